@@ -4,47 +4,115 @@ Main Flask application entry point
 """
 
 import os
+import sqlite3
+import tempfile
+import uuid
+import decimal
+import dataclasses
+from datetime import date
+import orjson
 from dotenv import load_dotenv
 
 # Load .env and set environment variables FIRST
 load_dotenv()
 
-# Set OpenAI API key directly
-import os
-
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from flask import Flask, Request, render_template
+from flask.json.provider import JSONProvider
+from werkzeug.http import http_date
+from jinja2 import FileSystemBytecodeCache
+from flask_login import LoginManager, login_required, current_user
 from flask_migrate import Migrate
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from datetime import datetime
-import json
-import io
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import load_only
+
+class ORJSONProvider(JSONProvider):
+    """orjson-backed JSON provider; output matches Flask's default (sorted keys, HTTP dates)"""
+    
+    options = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS |
+               orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME)
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, date):
+            return http_date(o)
+        if isinstance(o, (decimal.Decimal, uuid.UUID)):
+            return str(o)
+        if dataclasses.is_dataclass(o):
+            return dataclasses.asdict(o)
+        if hasattr(o, '__html__'):
+            return str(o.__html__())
+        raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.options).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+class SpooledUploadRequest(Request):
+    """Request that keeps uploaded files in memory only up to 1MB, then spools to disk"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.request_class = SpooledUploadRequest
+app.json = ORJSONProvider(app)
+# Must be set before jinja_env is first touched. Compiled templates are kept in
+# memory and on disk so restarts skip re-parsing; Flask already turns template
+# auto-reload off unless debug mode is on.
+app.jinja_options = {
+    **app.jinja_options,
+    'cache_size': 1000,
+    'bytecode_cache': FileSystemBytecodeCache(),
+}
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///vehicle_damage.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': 10,
+    'pool_pre_ping': True,
+    # JSON columns are (de)serialized by orjson instead of the stdlib json module
+    'json_serializer': lambda obj: orjson.dumps(obj).decode(),
+    'json_deserializer': orjson.loads
+}
 app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'static/uploads')
 app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB max file size
+# On-disk cache of OpenAI cost estimates; absolute, so it doesn't depend on the worker's cwd
+app.config['OPENAI_CACHE_DIR'] = os.getenv('OPENAI_CACHE_DIR', os.path.join(app.instance_path, 'oai_cache'))
 
-# Add custom Jinja2 filters
-@app.template_filter('from_json')
-def from_json_filter(value):
-    """Convert JSON string to Python object"""
-    if value is None:
-        return []
-    try:
-        return json.loads(value)
-    except (json.JSONDecodeError, TypeError):
-        return []
+# Sessions stay in Flask's signed cookie unless a Redis URL is configured
+SESSION_REDIS_URL = os.getenv('SESSION_REDIS_URL')
+if SESSION_REDIS_URL:
+    import redis
+    from flask_session import Session
+    
+    # One pool per process, shared by every request
+    session_redis_pool = redis.BlockingConnectionPool.from_url(
+        SESSION_REDIS_URL, max_connections=32, socket_keepalive=True
+    )
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis.Redis(connection_pool=session_redis_pool)
+    Session(app)
 
 # Initialize database
-from database_models import db, User, DamageReport
+from database_models import db, DamageReport, load_user_cached
 db.init_app(app)
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers proceed during writes; mmap/cache cut read syscalls"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in ('journal_mode=WAL', 'synchronous=NORMAL', 'mmap_size=268435456',
+                   'cache_size=-64000', 'temp_store=MEMORY'):
+        cursor.execute(f'PRAGMA {pragma}')
+    cursor.close()
 migrate = Migrate(app, db)
 
 # Initialize login manager
@@ -52,23 +120,25 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
 
-# Import blueprints
-from routes.auth import auth_bp
-from routes.damage_assessment import damage_bp
-from routes.reports import reports_bp
-from routes.api import api_bp
-from routes.admin import admin_bp
+def register_blueprints(app):
+    """Import and register route blueprints once the app is configured"""
+    from routes.auth import auth_bp
+    from routes.damage_assessment import damage_bp
+    from routes.reports import reports_bp
+    from routes.api import api_bp
+    from routes.admin import admin_bp
+    
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(damage_bp, url_prefix='/damage')
+    app.register_blueprint(reports_bp, url_prefix='/reports')
+    app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/admin')
 
-# Register blueprints
-app.register_blueprint(auth_bp, url_prefix='/auth')
-app.register_blueprint(damage_bp, url_prefix='/damage')
-app.register_blueprint(reports_bp, url_prefix='/reports')
-app.register_blueprint(api_bp, url_prefix='/api')
-app.register_blueprint(admin_bp, url_prefix='/admin')
+register_blueprints(app)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_user_cached(int(user_id))
 
 @app.route('/')
 def index():
@@ -77,7 +147,12 @@ def index():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    reports = DamageReport.query.filter_by(user_id=current_user.id).order_by(DamageReport.created_at.desc()).limit(10).all()
+    # Only load the columns the dashboard renders; skips the JSON text blobs
+    reports = DamageReport.query.options(load_only(
+        DamageReport.id, DamageReport.vehicle_type, DamageReport.damage_type,
+        DamageReport.severity, DamageReport.estimated_cost, DamageReport.status,
+        DamageReport.created_at
+    )).filter_by(user_id=current_user.id).order_by(DamageReport.created_at.desc()).limit(10).all()
     return render_template('dashboard.html', reports=reports)
 
 if __name__ == '__main__':
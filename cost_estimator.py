@@ -4,200 +4,287 @@ Cost Estimation System for Vehicle Damage Assessment
 
 import json
 import os
+import bisect
+import functools
+from types import MappingProxyType
 from typing import Dict, Any, List
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+COST_DATABASE_PATH = 'data/cost_database.json'
+
+def freeze_table(value: Any) -> Any:
+    """Recursively wrap dicts in read-only MappingProxyType views"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze_table(v) for k, v in value.items()})
+    return value
+
+# Default repair cost database, used when no JSON override exists on disk
+DEFAULT_COST_DATABASE = freeze_table({
+    "vehicle_types": {
+        "Car": {
+            "base_labor_rate": 800,
+            "parts_multiplier": 1.0
+        },
+        "Motorcycle": {
+            "base_labor_rate": 600,
+            "parts_multiplier": 0.8
+        },
+        "Scooter": {
+            "base_labor_rate": 500,
+            "parts_multiplier": 0.6
+        },
+        "Bicycle": {
+            "base_labor_rate": 300,
+            "parts_multiplier": 0.4
+        },
+        "Bus": {
+            "base_labor_rate": 1000,
+            "parts_multiplier": 2.0
+        },
+        "Truck": {
+            "base_labor_rate": 900,
+            "parts_multiplier": 1.5
+        },
+        "Van": {
+            "base_labor_rate": 850,
+            "parts_multiplier": 1.2
+        },
+        "Train": {
+            "base_labor_rate": 1200,
+            "parts_multiplier": 3.0
+        }
+    },
+    "damage_types": {
+        "Dent": {
+            "base_cost": 5000,
+            "labor_hours": 3,
+            "complexity_factor": 1.2
+        },
+        "Scratch": {
+            "base_cost": 3500,
+            "labor_hours": 2,
+            "complexity_factor": 1.0
+        },
+        "Broken Part": {
+            "base_cost": 8000,
+            "labor_hours": 5,
+            "complexity_factor": 1.8
+        },
+        "Crack": {
+            "base_cost": 6000,
+            "labor_hours": 3,
+            "complexity_factor": 1.4
+        },
+        "Rust": {
+            "base_cost": 7000,
+            "labor_hours": 4,
+            "complexity_factor": 1.5
+        },
+        "Paint Damage": {
+            "base_cost": 4500,
+            "labor_hours": 2.5,
+            "complexity_factor": 1.1
+        },
+        "Structural Damage": {
+            "base_cost": 20000,
+            "labor_hours": 12,
+            "complexity_factor": 2.5
+        },
+        "Glass Damage": {
+            "base_cost": 3000,
+            "labor_hours": 1.5,
+            "complexity_factor": 1.0
+        },
+        "Light Damage": {
+            "base_cost": 2500,
+            "labor_hours": 2,
+            "complexity_factor": 0.9
+        },
+        "Bumper Damage": {
+            "base_cost": 6500,
+            "labor_hours": 4,
+            "complexity_factor": 1.3
+        }
+    },
+    "severity_multipliers": {
+        "Minor": 0.5,
+        "Moderate": 1.0,
+        "Severe": 1.8,
+        "Critical": 2.5
+    }
+})
+
+# Labor rates by region
+LABOR_RATES = freeze_table({
+    "India": 800,
+    "US": 75,
+    "EU": 65,
+    "Asia": 45,
+    "Other": 50
+})
+
+# Part costs by vehicle type
+PART_COSTS = freeze_table({
+    "Car": {
+        "bumper": 5000,
+        "door": 8000,
+        "headlight": 2500,
+        "windshield": 4000,
+        "mirror": 1200,
+        "fender": 3500
+    },
+    "Motorcycle": {
+        "fairing": 3000,
+        "tank": 5000,
+        "headlight": 1200,
+        "mirror": 800,
+        "exhaust": 2500
+    },
+    "Scooter": {
+        "body_panel": 2000,
+        "headlight": 1000,
+        "mirror": 500,
+        "seat": 1200
+    },
+    "Bicycle": {
+        "frame": 3000,
+        "wheel": 1200,
+        "handlebar": 800,
+        "seat": 600
+    }
+})
+
+# Repair time in days by damage type, scaled by severity
+REPAIR_BASE_TIMES = {
+    'Dent': 1,
+    'Scratch': 1,
+    'Broken Part': 3,
+    'Crack': 2,
+    'Rust': 2,
+    'Paint Damage': 2,
+    'Structural Damage': 5,
+    'Glass Damage': 1,
+    'Light Damage': 1,
+    'Bumper Damage': 2
+}
+
+REPAIR_SEVERITY_MULTIPLIERS = {
+    'Minor': 0.5,
+    'Moderate': 1.0,
+    'Severe': 1.5,
+    'Critical': 2.0
+}
+
+REPAIR_TIMES = {
+    (damage_type, severity): max(1, int(base_time * multiplier))
+    for damage_type, base_time in REPAIR_BASE_TIMES.items()
+    for severity, multiplier in REPAIR_SEVERITY_MULTIPLIERS.items()
+}
+
+# Category groups that drive additional costs and recommendations
+HIGH_SEVERITIES = frozenset({'Severe', 'Critical'})
+PAINT_DAMAGE_TYPES = frozenset({'Paint Damage', 'Scratch'})
+MATERIAL_DAMAGE_TYPES = frozenset({'Structural Damage', 'Broken Part'})
+HEAVY_VEHICLE_TYPES = frozenset({'Bus', 'Truck', 'Train'})
+
+# Lower bound of each confidence level above 'Very Low'
+CONFIDENCE_THRESHOLDS = (0.3, 0.5, 0.7, 0.9)
+CONFIDENCE_LEVELS = ('Very Low', 'Low', 'Medium', 'High', 'Very High')
+
+def load_cost_database(path: str = COST_DATABASE_PATH) -> Dict[str, Any]:
+    """Load repair cost database"""
+    try:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f)
+        return DEFAULT_COST_DATABASE
+    except Exception as e:
+        logger.error(f"Error loading cost database: {e}")
+        return DEFAULT_COST_DATABASE
+
+# Read once at import; every CostEstimator shares these read-only tables
+_COST_DATABASE = freeze_table(load_cost_database())
+
 class CostEstimator:
-    def __init__(self):
-        self.cost_database = self.load_cost_database()
-        self.labor_rates = self.load_labor_rates()
-        self.part_costs = self.load_part_costs()
+    __slots__ = (
+        'cost_database', 'labor_rates', 'part_costs',
+        '_vehicle_index', '_damage_index', '_severity_index', '_default_indices',
+        '_base_cost_table', '_additional_costs',
+        '_estimate_cost_cached',
+    )
     
-    def load_cost_database(self) -> Dict[str, Any]:
-        """Load repair cost database"""
-        try:
-            cost_db_path = 'data/cost_database.json'
-            if os.path.exists(cost_db_path):
-                with open(cost_db_path, 'r') as f:
-                    return json.load(f)
-            else:
-                # Create default cost database
-                return self.create_default_cost_database()
-        except Exception as e:
-            logger.error(f"Error loading cost database: {e}")
-            return self.create_default_cost_database()
+    def __init__(self):
+        self.cost_database = _COST_DATABASE
+        self.labor_rates = LABOR_RATES
+        self.part_costs = PART_COSTS
+        self.build_cost_tables()
+        # Per-instance memo so update_cost_database() can invalidate it
+        self._estimate_cost_cached = functools.lru_cache(maxsize=4096)(self._compute_cost_estimate)
     
-    def create_default_cost_database(self) -> Dict[str, Any]:
-        """Create default cost database with sample data"""
-        return {
-            "vehicle_types": {
-                "Car": {
-                    "base_labor_rate": 800,
-                    "parts_multiplier": 1.0
-                },
-                "Motorcycle": {
-                    "base_labor_rate": 600,
-                    "parts_multiplier": 0.8
-                },
-                "Scooter": {
-                    "base_labor_rate": 500,
-                    "parts_multiplier": 0.6
-                },
-                "Bicycle": {
-                    "base_labor_rate": 300,
-                    "parts_multiplier": 0.4
-                },
-                "Bus": {
-                    "base_labor_rate": 1000,
-                    "parts_multiplier": 2.0
-                },
-                "Truck": {
-                    "base_labor_rate": 900,
-                    "parts_multiplier": 1.5
-                },
-                "Van": {
-                    "base_labor_rate": 850,
-                    "parts_multiplier": 1.2
-                },
-                "Train": {
-                    "base_labor_rate": 1200,
-                    "parts_multiplier": 3.0
-                }
-            },
-            "damage_types": {
-                "Dent": {
-                    "base_cost": 5000,
-                    "labor_hours": 3,
-                    "complexity_factor": 1.2
-                },
-                "Scratch": {
-                    "base_cost": 3500,
-                    "labor_hours": 2,
-                    "complexity_factor": 1.0
-                },
-                "Broken Part": {
-                    "base_cost": 8000,
-                    "labor_hours": 5,
-                    "complexity_factor": 1.8
-                },
-                "Crack": {
-                    "base_cost": 6000,
-                    "labor_hours": 3,
-                    "complexity_factor": 1.4
-                },
-                "Rust": {
-                    "base_cost": 7000,
-                    "labor_hours": 4,
-                    "complexity_factor": 1.5
-                },
-                "Paint Damage": {
-                    "base_cost": 4500,
-                    "labor_hours": 2.5,
-                    "complexity_factor": 1.1
-                },
-                "Structural Damage": {
-                    "base_cost": 20000,
-                    "labor_hours": 12,
-                    "complexity_factor": 2.5
-                },
-                "Glass Damage": {
-                    "base_cost": 3000,
-                    "labor_hours": 1.5,
-                    "complexity_factor": 1.0
-                },
-                "Light Damage": {
-                    "base_cost": 2500,
-                    "labor_hours": 2,
-                    "complexity_factor": 0.9
-                },
-                "Bumper Damage": {
-                    "base_cost": 6500,
-                    "labor_hours": 4,
-                    "complexity_factor": 1.3
-                }
-            },
-            "severity_multipliers": {
-                "Minor": 0.5,
-                "Moderate": 1.0,
-                "Severe": 1.8,
-                "Critical": 2.5
-            }
+    def build_cost_tables(self):
+        """Precompute parts/labor and additional costs for every known combination"""
+        vehicle_types = self.cost_database['vehicle_types']
+        damage_types = self.cost_database['damage_types']
+        severity_multipliers = self.cost_database['severity_multipliers']
+        
+        # Category names are mapped to integer codes once; lookups then index nested lists
+        self._vehicle_index = {name: i for i, name in enumerate(vehicle_types)}
+        self._damage_index = {name: i for i, name in enumerate(damage_types)}
+        self._severity_index = {name: i for i, name in enumerate(severity_multipliers)}
+        # Unknown names fall back to Car / Scratch / Moderate (Moderate's multiplier is 1.0)
+        self._default_indices = (self._vehicle_index['Car'], self._damage_index['Scratch'],
+                                 self._severity_index['Moderate'])
+        
+        self._base_cost_table = [
+            [
+                [
+                    (damage_info['base_cost'] * vehicle_info['parts_multiplier'] * severity_multiplier,
+                     damage_info['labor_hours'] * vehicle_info['base_labor_rate'] *
+                     damage_info['complexity_factor'] * severity_multiplier)
+                    for severity_multiplier in severity_multipliers.values()
+                ]
+                for damage_info in damage_types.values()
+            ]
+            for vehicle_info in vehicle_types.values()
+        ]
+        
+        self._additional_costs = {
+            (vehicle_type, damage_type, severity): self.calculate_additional_costs(vehicle_type, damage_type, severity)
+            for vehicle_type in vehicle_types
+            for damage_type in damage_types
+            for severity in severity_multipliers
         }
     
-    def load_labor_rates(self) -> Dict[str, float]:
-        """Load labor rates by region"""
-        return {
-            "India": 800,
-            "US": 75,
-            "EU": 65,
-            "Asia": 45,
-            "Other": 50
-        }
+    def lookup_base_costs(self, vehicle_type: str, damage_type: str, severity: str) -> tuple:
+        """Return (parts_cost, labor_cost), falling back to Car/Scratch/Moderate per field"""
+        default_vehicle, default_damage, default_severity = self._default_indices
+        return self._base_cost_table[self._vehicle_index.get(vehicle_type, default_vehicle)][
+            self._damage_index.get(damage_type, default_damage)][
+            self._severity_index.get(severity, default_severity)]
     
-    def load_part_costs(self) -> Dict[str, Dict[str, float]]:
-        """Load part costs by vehicle type"""
-        return {
-            "Car": {
-                "bumper": 5000,
-                "door": 8000,
-                "headlight": 2500,
-                "windshield": 4000,
-                "mirror": 1200,
-                "fender": 3500
-            },
-            "Motorcycle": {
-                "fairing": 3000,
-                "tank": 5000,
-                "headlight": 1200,
-                "mirror": 800,
-                "exhaust": 2500
-            },
-            "Scooter": {
-                "body_panel": 2000,
-                "headlight": 1000,
-                "mirror": 500,
-                "seat": 1200
-            },
-            "Bicycle": {
-                "frame": 3000,
-                "wheel": 1200,
-                "handlebar": 800,
-                "seat": 600
-            }
-        }
+    def lookup_additional_costs(self, vehicle_type: str, damage_type: str, severity: str) -> float:
+        """Return precomputed additional costs, computing them for unknown combinations"""
+        additional_costs = self._additional_costs.get((vehicle_type, damage_type, severity))
+        if additional_costs is None:
+            additional_costs = self.calculate_additional_costs(vehicle_type, damage_type, severity)
+        return additional_costs
     
     def estimate_cost(self, damage_results: Dict[str, Any]) -> Dict[str, Any]:
-        """Estimate repair cost based on damage analysis results"""
+        """Estimate repair cost based on damage analysis results.
+        
+        The confidence-independent costs are memoized per (vehicle, damage,
+        severity); the confidence adjustment is applied to the raw confidence.
+        """
         try:
             vehicle_type = damage_results.get('vehicle_type', 'Car')
             damage_type = damage_results.get('damage_type', 'Unknown')
             severity = damage_results.get('severity', 'Moderate')
             confidence = damage_results.get('confidence', 0.5)
             
-            # Get base costs
-            vehicle_info = self.cost_database['vehicle_types'].get(vehicle_type, 
-                                                                 self.cost_database['vehicle_types']['Car'])
-            damage_info = self.cost_database['damage_types'].get(damage_type, 
-                                                               self.cost_database['damage_types']['Scratch'])
-            severity_multiplier = self.cost_database['severity_multipliers'].get(severity, 1.0)
-            
-            # Calculate base cost
-            base_cost = damage_info['base_cost']
-            labor_hours = damage_info['labor_hours']
-            complexity_factor = damage_info['complexity_factor']
-            
-            # Apply vehicle type multiplier
-            vehicle_multiplier = vehicle_info['parts_multiplier']
-            
-            # Calculate parts cost
-            parts_cost = base_cost * vehicle_multiplier * severity_multiplier
-            
-            # Calculate labor cost
-            labor_rate = vehicle_info['base_labor_rate']
-            labor_cost = labor_hours * labor_rate * complexity_factor * severity_multiplier
+            parts_cost, labor_cost, additional_costs = self._estimate_cost_cached(vehicle_type, damage_type, severity)
             
             # Apply confidence adjustment (lower confidence = higher uncertainty = higher cost)
             confidence_factor = 1.0 + (1.0 - confidence) * 0.3  # Up to 30% increase for low confidence
@@ -205,9 +292,6 @@ class CostEstimator:
             # Calculate total cost
             total_cost = (parts_cost + labor_cost) * confidence_factor
             
-            # Add additional costs
-            additional_costs = self.calculate_additional_costs(vehicle_type, damage_type, severity)
-            
             # Calculate breakdown
             cost_breakdown = {
                 'parts_cost': round(parts_cost, 2),
@@ -238,23 +322,28 @@ class CostEstimator:
                 'error': str(e)
             }
     
+    def _compute_cost_estimate(self, vehicle_type: str, damage_type: str, severity: str) -> tuple:
+        """Uncached (parts_cost, labor_cost, additional_costs) backing estimate_cost"""
+        parts_cost, labor_cost = self.lookup_base_costs(vehicle_type, damage_type, severity)
+        return parts_cost, labor_cost, self.lookup_additional_costs(vehicle_type, damage_type, severity)
+    
     def calculate_additional_costs(self, vehicle_type: str, damage_type: str, severity: str) -> float:
         """Calculate additional costs like paint, materials, etc."""
         additional_cost = 0
         
         # Paint costs
-        if damage_type in ['Paint Damage', 'Scratch']:
+        if damage_type in PAINT_DAMAGE_TYPES:
             paint_cost = 2000 if vehicle_type == 'Car' else 1000
             additional_cost += paint_cost
         
         # Material costs
-        if damage_type in ['Structural Damage', 'Broken Part']:
-            material_cost = 3500 if severity in ['Severe', 'Critical'] else 1800
+        if damage_type in MATERIAL_DAMAGE_TYPES:
+            material_cost = 3500 if severity in HIGH_SEVERITIES else 1800
             additional_cost += material_cost
         
         # Specialized equipment costs
-        if vehicle_type in ['Bus', 'Truck', 'Train']:
-            equipment_cost = 2500 if severity in ['Severe', 'Critical'] else 1200
+        if vehicle_type in HEAVY_VEHICLE_TYPES:
+            equipment_cost = 2500 if severity in HIGH_SEVERITIES else 1200
             additional_cost += equipment_cost
         
         # Labor overhead (shop supplies, insurance, etc.)
@@ -265,95 +354,66 @@ class CostEstimator:
     
     def generate_repair_recommendations(self, vehicle_type: str, damage_type: str, severity: str, cost: float) -> List[Dict[str, Any]]:
         """Generate repair recommendations based on damage analysis"""
-        recommendations = []
-        
-        # Basic repair recommendation
-        recommendations.append({
-            'type': 'Basic Repair',
-            'description': f'Standard repair for {damage_type.lower()} damage',
-            'estimated_cost': round(cost * 0.8, 2),
-            'time_estimate': self.estimate_repair_time(damage_type, severity),
-            'priority': 'High'
-        })
+        repair_time = self.estimate_repair_time(damage_type, severity)
         
-        # Premium repair option for severe damage
-        if severity in ['Severe', 'Critical']:
-            recommendations.append({
+        # (applies, builder) pairs in display order; only applicable dicts get built
+        specs = (
+            # Basic repair recommendation
+            (True, lambda: {
+                'type': 'Basic Repair',
+                'description': f'Standard repair for {damage_type.lower()} damage',
+                'estimated_cost': round(cost * 0.8, 2),
+                'time_estimate': repair_time,
+                'priority': 'High'
+            }),
+            # Premium repair option for severe damage
+            (severity in HIGH_SEVERITIES, lambda: {
                 'type': 'Premium Repair',
                 'description': 'High-quality repair with warranty',
                 'estimated_cost': round(cost * 1.3, 2),
-                'time_estimate': self.estimate_repair_time(damage_type, severity) + 2,
+                'time_estimate': repair_time + 2,
                 'priority': 'Medium'
-            })
-        
-        # Insurance claim recommendation
-        if cost > 1000:
-            recommendations.append({
+            }),
+            # Insurance claim recommendation
+            (cost > 1000, lambda: {
                 'type': 'Insurance Claim',
                 'description': 'Consider filing an insurance claim',
                 'estimated_cost': round(cost * 0.1, 2),  # Deductible
                 'time_estimate': 7,  # Days for processing
                 'priority': 'High'
-            })
-        
-        # DIY option for minor damage
-        if severity == 'Minor' and damage_type in ['Scratch', 'Paint Damage']:
-            recommendations.append({
+            }),
+            # DIY option for minor damage
+            (severity == 'Minor' and damage_type in PAINT_DAMAGE_TYPES, lambda: {
                 'type': 'DIY Repair',
                 'description': 'Do-it-yourself repair kit',
                 'estimated_cost': round(cost * 0.2, 2),
                 'time_estimate': 1,
                 'priority': 'Low'
-            })
+            }),
+        )
         
-        return recommendations
+        return [build() for applies, build in specs if applies]
     
     def estimate_repair_time(self, damage_type: str, severity: str) -> int:
         """Estimate repair time in days"""
-        base_times = {
-            'Dent': 1,
-            'Scratch': 1,
-            'Broken Part': 3,
-            'Crack': 2,
-            'Rust': 2,
-            'Paint Damage': 2,
-            'Structural Damage': 5,
-            'Glass Damage': 1,
-            'Light Damage': 1,
-            'Bumper Damage': 2
-        }
-        
-        severity_multipliers = {
-            'Minor': 0.5,
-            'Moderate': 1.0,
-            'Severe': 1.5,
-            'Critical': 2.0
-        }
-        
-        base_time = base_times.get(damage_type, 2)
-        multiplier = severity_multipliers.get(severity, 1.0)
+        repair_time = REPAIR_TIMES.get((damage_type, severity))
+        if repair_time is not None:
+            return repair_time
         
+        base_time = REPAIR_BASE_TIMES.get(damage_type, 2)
+        multiplier = REPAIR_SEVERITY_MULTIPLIERS.get(severity, 1.0)
         return max(1, int(base_time * multiplier))
     
     def get_confidence_level(self, confidence: float) -> str:
         """Get confidence level description"""
-        if confidence >= 0.9:
-            return 'Very High'
-        elif confidence >= 0.7:
-            return 'High'
-        elif confidence >= 0.5:
-            return 'Medium'
-        elif confidence >= 0.3:
-            return 'Low'
-        else:
-            return 'Very Low'
+        return CONFIDENCE_LEVELS[bisect.bisect_right(CONFIDENCE_THRESHOLDS, confidence)]
     
-    def save_cost_database(self, path: str = 'data/cost_database.json'):
+    def save_cost_database(self, path: str = COST_DATABASE_PATH):
         """Save cost database to file"""
         try:
             os.makedirs(os.path.dirname(path), exist_ok=True)
             with open(path, 'w') as f:
-                json.dump(self.cost_database, f, indent=2)
+                json.dump(self.cost_database, f, indent=2, default=dict)
             logger.info(f"Cost database saved to {path}")
         except Exception as e:
             logger.error(f"Error saving cost database: {e}")
@@ -361,7 +421,9 @@ class CostEstimator:
     def update_cost_database(self, new_costs: Dict[str, Any]):
         """Update cost database with new data"""
         try:
-            self.cost_database.update(new_costs)
+            self.cost_database = freeze_table({**self.cost_database, **new_costs})
+            self.build_cost_tables()
+            self._estimate_cost_cached.cache_clear()
             self.save_cost_database()
             logger.info("Cost database updated successfully")
         except Exception as e:
@@ -3,17 +3,316 @@ Enhanced Cost Estimation System for Vehicle Damage Assessment
 Integrates with Gemini AI for realistic Indian pricing
 """
 
-import json
+import asyncio
 import os
+import functools
 import logging
+import numpy as np
+import orjson
 from typing import Dict, Any, List
-import openai
 from datetime import datetime
-import requests
+from diskcache import Cache
+from flask import current_app, has_app_context
+from cost_estimator import freeze_table
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Prompt templates, formatted per request
+_COST_PROMPT_TMPL = """\
+As an expert automotive repair cost estimator in India, please provide a detailed cost breakdown for the following vehicle damage:
+
+Vehicle Type: {vehicle_type}
+Damage Type: {damage_type}
+Severity: {severity}
+Location: {location}
+Confidence Level: {confidence:.2f}
+
+Please provide a realistic cost estimate in Indian Rupees (INR) considering:
+1. Current Indian market rates (2024)
+2. Regional pricing variations
+3. Labor costs in {location}
+4. Parts availability and costs
+5. GST (18%) and other taxes
+6. Workshop overhead costs
+
+Respond with a single JSON object with these fields:
+total_cost, cost_breakdown (parts_cost, labor_cost, paint_cost, taxes_gst, overhead_cost, additional_costs),
+repair_time_days, complexity_level (Simple/Moderate/Complex/Expert),
+market_analysis (price_range: Low/Medium/High/Premium, availability: Readily Available/Moderate/Scarce/Rare, regional_factor),
+recommendations (list of repair recommendations, cost-saving tips and quality considerations), confidence_score.
+All amounts are numbers in INR.
+
+Be realistic and consider Indian market conditions, local availability of parts, and regional labor costs.
+"""
+
+_INSIGHTS_PROMPT_TMPL = """\
+Provide current market insights for vehicle repair in India:
+
+Vehicle Type: {vehicle_type}
+Damage Type: {damage_type}
+Location: {location}
+
+Include:
+1. Current market trends
+2. Price fluctuations
+3. Parts availability
+4. Popular repair methods
+5. Quality considerations
+
+Keep it concise and relevant to Indian market.
+"""
+
+# Upper bound on concurrent OpenAI requests per batch, to stay within rate limits
+MAX_CONCURRENT_REQUESTS = 8
+
+RESPONSE_CACHE_TTL = 86400 * 7  # seconds
+
+@functools.cache
+def response_cache() -> Cache:
+    """Persistent cache of OpenAI estimates, shared by all workers on the host; opened on first use"""
+    if has_app_context():
+        directory = current_app.config['OPENAI_CACHE_DIR']
+    else:
+        # Same place as the app's default: <project>/instance/oai_cache
+        directory = os.getenv('OPENAI_CACHE_DIR') or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'instance', 'oai_cache')
+    return Cache(directory, size_limit=100_000_000)
+
+# Base cost database with Indian market data, built once and shared read-only
+_BASE_COSTS = freeze_table({
+    "vehicle_types": {
+        "Car": {
+            "base_labor_rate": 1200,  # INR per hour
+            "parts_multiplier": 1.0,
+            "complexity_factor": 1.0
+        },
+        "SUV": {
+            "base_labor_rate": 1400,
+            "parts_multiplier": 1.2,
+            "complexity_factor": 1.1
+        },
+        "Hatchback": {
+            "base_labor_rate": 1000,
+            "parts_multiplier": 0.8,
+            "complexity_factor": 0.9
+        },
+        "Sedan": {
+            "base_labor_rate": 1200,
+            "parts_multiplier": 1.0,
+            "complexity_factor": 1.0
+        },
+        "Motorcycle": {
+            "base_labor_rate": 600,
+            "parts_multiplier": 0.4,
+            "complexity_factor": 0.7
+        },
+        "Scooter": {
+            "base_labor_rate": 500,
+            "parts_multiplier": 0.3,
+            "complexity_factor": 0.6
+        },
+        "Truck": {
+            "base_labor_rate": 1800,
+            "parts_multiplier": 2.0,
+            "complexity_factor": 1.5
+        },
+        "Bus": {
+            "base_labor_rate": 2000,
+            "parts_multiplier": 2.5,
+            "complexity_factor": 1.8
+        }
+    },
+    "damage_types": {
+        "Scratch": {
+            "base_cost": 2500,
+            "labor_hours": 2,
+            "complexity_factor": 1.0,
+            "parts_cost": 800
+        },
+        "Dent": {
+            "base_cost": 4000,
+            "labor_hours": 3,
+            "complexity_factor": 1.2,
+            "parts_cost": 1200
+        },
+        "Paint Damage": {
+            "base_cost": 3500,
+            "labor_hours": 2.5,
+            "complexity_factor": 1.1,
+            "parts_cost": 1500
+        },
+        "Bumper Damage": {
+            "base_cost": 8000,
+            "labor_hours": 4,
+            "complexity_factor": 1.3,
+            "parts_cost": 3500
+        },
+        "Broken Part": {
+            "base_cost": 12000,
+            "labor_hours": 6,
+            "complexity_factor": 1.8,
+            "parts_cost": 6000
+        },
+        "Crack": {
+            "base_cost": 6000,
+            "labor_hours": 3,
+            "complexity_factor": 1.4,
+            "parts_cost": 2500
+        },
+        "Rust": {
+            "base_cost": 8000,
+            "labor_hours": 4,
+            "complexity_factor": 1.5,
+            "parts_cost": 3000
+        },
+        "Structural Damage": {
+            "base_cost": 25000,
+            "labor_hours": 12,
+            "complexity_factor": 2.5,
+            "parts_cost": 15000
+        },
+        "Minor Dent": {
+            "base_cost": 3000,
+            "labor_hours": 2,
+            "complexity_factor": 1.0,
+            "parts_cost": 1000
+        },
+        "Surface Damage": {
+            "base_cost": 2000,
+            "labor_hours": 1.5,
+            "complexity_factor": 0.9,
+            "parts_cost": 500
+        },
+        "Panel Damage": {
+            "base_cost": 6000,
+            "labor_hours": 4,
+            "complexity_factor": 1.3,
+            "parts_cost": 2000
+        },
+        "Major Collision": {
+            "base_cost": 25000,
+            "labor_hours": 12,
+            "complexity_factor": 2.5,
+            "parts_cost": 15000
+        },
+        "Total Loss": {
+            "base_cost": 100000,
+            "labor_hours": 40,
+            "complexity_factor": 5.0,
+            "parts_cost": 80000
+        },
+        "Glass Damage": {
+            "base_cost": 4000,
+            "labor_hours": 1.5,
+            "complexity_factor": 1.0,
+            "parts_cost": 2000
+        },
+        "Headlight Damage": {
+            "base_cost": 5000,
+            "labor_hours": 2,
+            "complexity_factor": 1.1,
+            "parts_cost": 3000
+        }
+    },
+    "severity_multipliers": {
+        "Minor": 0.6,
+        "Moderate": 1.0,
+        "Severe": 1.6,
+        "Critical": 2.2
+    },
+    "indian_market_factors": {
+        "metro_cities": 1.3,  # Mumbai, Delhi, Bangalore, Chennai
+        "tier1_cities": 1.1,  # Pune, Hyderabad, Ahmedabad, etc.
+        "tier2_cities": 0.9,  # Smaller cities
+        "rural_areas": 0.7    # Rural areas
+    }
+})
+
+# Indian cities and their market classification
+_INDIAN_REGIONS = freeze_table({
+    "mumbai": "metro_cities",
+    "delhi": "metro_cities",
+    "bangalore": "metro_cities",
+    "chennai": "metro_cities",
+    "kolkata": "metro_cities",
+    "hyderabad": "tier1_cities",
+    "pune": "tier1_cities",
+    "ahmedabad": "tier1_cities",
+    "jaipur": "tier1_cities",
+    "lucknow": "tier1_cities",
+    "kanpur": "tier1_cities",
+    "nagpur": "tier1_cities",
+    "indore": "tier1_cities",
+    "thane": "tier1_cities",
+    "bhopal": "tier1_cities",
+    "visakhapatnam": "tier1_cities",
+    "pimpri": "tier1_cities",
+    "patna": "tier1_cities",
+    "vadodara": "tier1_cities",
+    "ghaziabad": "tier1_cities",
+    "ludhiana": "tier1_cities",
+    "agra": "tier2_cities",
+    "nashik": "tier2_cities",
+    "faridabad": "tier2_cities",
+    "meerut": "tier2_cities",
+    "rajkot": "tier2_cities",
+    "kalyan": "tier2_cities",
+    "vasai": "tier2_cities",
+    "varanasi": "tier2_cities",
+    "srinagar": "tier2_cities"
+})
+
+# Damage types that carry paint work, decided once instead of per estimate
+_PAINT_DAMAGE_TYPES = frozenset(t for t in _BASE_COSTS['damage_types'] if 'paint' in t.lower())
+
+# Model severity labels mapped to the cost estimator's severity names
+_SEVERITY_MAP = {
+    '01-minor': 'Minor',
+    '02-moderate': 'Moderate', 
+    '03-severe': 'Severe',
+    'minor': 'Minor',
+    'moderate': 'Moderate',
+    'severe': 'Severe',
+    'Minor': 'Minor',
+    'Moderate': 'Moderate',
+    'Severe': 'Severe'
+}
+
+# Repair recommendation fragments, combined per estimate
+_BASE_RECS = ("Get quotes from at least 3 different workshops", "Check for insurance coverage before proceeding")
+_HIGH_COST_RECS = ("Consider filing an insurance claim", "Verify workshop is insurance-approved")
+_SEVERE_RECS = ("Get a detailed inspection before repair", "Consider OEM parts for better quality")
+_PAINT_MATCH_RECS = ("Ask about paint matching guarantee",)
+_STRUCTURAL_RECS = ("Ensure structural integrity is maintained", "Get certification from authorized workshop")
+_HEAVY_VEHICLE_RECS = ("Check for commercial vehicle insurance",)
+
+_SEVERE_TYPES = frozenset({"Severe", "Critical"})
+_PAINT_MATCH_TYPES = frozenset({"Paint Damage", "Scratch"})
+_HEAVY_VEHICLES = frozenset({"Truck", "Bus"})
+
+# (city, region) pairs that get_region_classification checks in order with a substring test;
+# when a location names several cities, the first listed wins
+_CITY_REGIONS = tuple(_INDIAN_REGIONS.items())
+
+# Base cost tables as arrays indexed by category code, for vectorized backfills
+_VEHICLE_CODES = {name: i for i, name in enumerate(_BASE_COSTS['vehicle_types'])}
+_VEHICLE_PARTS_MULT = np.array([v['parts_multiplier'] for v in _BASE_COSTS['vehicle_types'].values()])
+_VEHICLE_LABOR_RATE = np.array([v['base_labor_rate'] for v in _BASE_COSTS['vehicle_types'].values()])
+_VEHICLE_COMPLEXITY = np.array([v['complexity_factor'] for v in _BASE_COSTS['vehicle_types'].values()])
+
+_DAMAGE_CODES = {name: i for i, name in enumerate(_BASE_COSTS['damage_types'])}
+_DAMAGE_PARTS = np.array([d['parts_cost'] for d in _BASE_COSTS['damage_types'].values()])
+_DAMAGE_LABOR_HOURS = np.array([d['labor_hours'] for d in _BASE_COSTS['damage_types'].values()])
+_DAMAGE_PAINT = np.array([d.get('paint_cost', 0) if name in _PAINT_DAMAGE_TYPES else 0
+                          for name, d in _BASE_COSTS['damage_types'].items()])
+
+_SEVERITY_CODES = {name: i for i, name in enumerate(_BASE_COSTS['severity_multipliers'])}
+_SEV_MULT = np.array(list(_BASE_COSTS['severity_multipliers'].values()))
+
+_REGION_CODES = {name: i for i, name in enumerate(_BASE_COSTS['indian_market_factors'])}
+_REGION_FACTOR = np.array(list(_BASE_COSTS['indian_market_factors'].values()))
+
 class EnhancedCostEstimator:
     def __init__(self, openai_api_key: str = None):
         """Initialize enhanced cost estimator with OpenAI AI integration"""
@@ -23,7 +322,9 @@ class EnhancedCostEstimator:
         
         if self.openai_api_key:
             try:
-                self.client = openai.OpenAI(api_key=self.openai_api_key)
+                # OpenAI SDK and httpx are only imported when a key is configured
+                from models.openai_client import get_openai_client
+                get_openai_client(self.openai_api_key)
                 self.openai_available = True
                 logger.info("Enhanced cost estimator with OpenAI AI initialized")
             except Exception as e:
@@ -33,191 +334,50 @@ class EnhancedCostEstimator:
             self.openai_available = False
             logger.warning("No OpenAI API key provided. Using fallback pricing.")
     
+    @property
+    def client(self):
+        """Shared OpenAI client, looked up on each use so a forked worker gets its own connection pool"""
+        from models.openai_client import get_openai_client
+        return get_openai_client(self.openai_api_key)
+    
     def load_base_costs(self) -> Dict[str, Any]:
         """Load base cost database with Indian market data"""
-        return {
-            "vehicle_types": {
-                "Car": {
-                    "base_labor_rate": 1200,  # INR per hour
-                    "parts_multiplier": 1.0,
-                    "complexity_factor": 1.0
-                },
-                "SUV": {
-                    "base_labor_rate": 1400,
-                    "parts_multiplier": 1.2,
-                    "complexity_factor": 1.1
-                },
-                "Hatchback": {
-                    "base_labor_rate": 1000,
-                    "parts_multiplier": 0.8,
-                    "complexity_factor": 0.9
-                },
-                "Sedan": {
-                    "base_labor_rate": 1200,
-                    "parts_multiplier": 1.0,
-                    "complexity_factor": 1.0
-                },
-                "Motorcycle": {
-                    "base_labor_rate": 600,
-                    "parts_multiplier": 0.4,
-                    "complexity_factor": 0.7
-                },
-                "Scooter": {
-                    "base_labor_rate": 500,
-                    "parts_multiplier": 0.3,
-                    "complexity_factor": 0.6
-                },
-                "Truck": {
-                    "base_labor_rate": 1800,
-                    "parts_multiplier": 2.0,
-                    "complexity_factor": 1.5
-                },
-                "Bus": {
-                    "base_labor_rate": 2000,
-                    "parts_multiplier": 2.5,
-                    "complexity_factor": 1.8
-                }
-            },
-            "damage_types": {
-                "Scratch": {
-                    "base_cost": 2500,
-                    "labor_hours": 2,
-                    "complexity_factor": 1.0,
-                    "parts_cost": 800
-                },
-                "Dent": {
-                    "base_cost": 4000,
-                    "labor_hours": 3,
-                    "complexity_factor": 1.2,
-                    "parts_cost": 1200
-                },
-                "Paint Damage": {
-                    "base_cost": 3500,
-                    "labor_hours": 2.5,
-                    "complexity_factor": 1.1,
-                    "parts_cost": 1500
-                },
-                "Bumper Damage": {
-                    "base_cost": 8000,
-                    "labor_hours": 4,
-                    "complexity_factor": 1.3,
-                    "parts_cost": 3500
-                },
-                "Broken Part": {
-                    "base_cost": 12000,
-                    "labor_hours": 6,
-                    "complexity_factor": 1.8,
-                    "parts_cost": 6000
-                },
-                "Crack": {
-                    "base_cost": 6000,
-                    "labor_hours": 3,
-                    "complexity_factor": 1.4,
-                    "parts_cost": 2500
-                },
-                "Rust": {
-                    "base_cost": 8000,
-                    "labor_hours": 4,
-                    "complexity_factor": 1.5,
-                    "parts_cost": 3000
-                },
-                "Structural Damage": {
-                    "base_cost": 25000,
-                    "labor_hours": 12,
-                    "complexity_factor": 2.5,
-                    "parts_cost": 15000
-                },
-                "Minor Dent": {
-                    "base_cost": 3000,
-                    "labor_hours": 2,
-                    "complexity_factor": 1.0,
-                    "parts_cost": 1000
-                },
-                "Surface Damage": {
-                    "base_cost": 2000,
-                    "labor_hours": 1.5,
-                    "complexity_factor": 0.9,
-                    "parts_cost": 500
-                },
-                "Panel Damage": {
-                    "base_cost": 6000,
-                    "labor_hours": 4,
-                    "complexity_factor": 1.3,
-                    "parts_cost": 2000
-                },
-                "Major Collision": {
-                    "base_cost": 25000,
-                    "labor_hours": 12,
-                    "complexity_factor": 2.5,
-                    "parts_cost": 15000
-                },
-                "Total Loss": {
-                    "base_cost": 100000,
-                    "labor_hours": 40,
-                    "complexity_factor": 5.0,
-                    "parts_cost": 80000
-                },
-                "Glass Damage": {
-                    "base_cost": 4000,
-                    "labor_hours": 1.5,
-                    "complexity_factor": 1.0,
-                    "parts_cost": 2000
-                },
-                "Headlight Damage": {
-                    "base_cost": 5000,
-                    "labor_hours": 2,
-                    "complexity_factor": 1.1,
-                    "parts_cost": 3000
-                }
-            },
-            "severity_multipliers": {
-                "Minor": 0.6,
-                "Moderate": 1.0,
-                "Severe": 1.6,
-                "Critical": 2.2
-            },
-            "indian_market_factors": {
-                "metro_cities": 1.3,  # Mumbai, Delhi, Bangalore, Chennai
-                "tier1_cities": 1.1,  # Pune, Hyderabad, Ahmedabad, etc.
-                "tier2_cities": 0.9,  # Smaller cities
-                "rural_areas": 0.7    # Rural areas
-            }
-        }
+        return _BASE_COSTS
     
     def load_indian_regions(self) -> Dict[str, str]:
         """Load Indian regions and their classifications"""
-        return {
-            "mumbai": "metro_cities",
-            "delhi": "metro_cities",
-            "bangalore": "metro_cities",
-            "chennai": "metro_cities",
-            "kolkata": "metro_cities",
-            "hyderabad": "tier1_cities",
-            "pune": "tier1_cities",
-            "ahmedabad": "tier1_cities",
-            "jaipur": "tier1_cities",
-            "lucknow": "tier1_cities",
-            "kanpur": "tier1_cities",
-            "nagpur": "tier1_cities",
-            "indore": "tier1_cities",
-            "thane": "tier1_cities",
-            "bhopal": "tier1_cities",
-            "visakhapatnam": "tier1_cities",
-            "pimpri": "tier1_cities",
-            "patna": "tier1_cities",
-            "vadodara": "tier1_cities",
-            "ghaziabad": "tier1_cities",
-            "ludhiana": "tier1_cities",
-            "agra": "tier2_cities",
-            "nashik": "tier2_cities",
-            "faridabad": "tier2_cities",
-            "meerut": "tier2_cities",
-            "rajkot": "tier2_cities",
-            "kalyan": "tier2_cities",
-            "vasai": "tier2_cities",
-            "varanasi": "tier2_cities",
-            "srinagar": "tier2_cities"
-        }
+        return _INDIAN_REGIONS
+    
+    def build_cost_prompt(self, damage_results: Dict[str, Any]) -> str:
+        """Build the OpenAI cost estimation prompt for one damage result"""
+        vehicle_type = damage_results.get('vehicle_type', 'Car')
+        damage_type = damage_results.get('damage_type', 'Scratch')
+        raw_severity = damage_results.get('severity', 'Moderate')
+        severity = _SEVERITY_MAP.get(raw_severity, 'Moderate')
+        confidence = damage_results.get('confidence', 0.5)
+        location = damage_results.get('location', 'Mumbai')
+        
+        return _COST_PROMPT_TMPL.format(
+            vehicle_type=vehicle_type,
+            damage_type=damage_type,
+            severity=severity,
+            location=location,
+            confidence=confidence
+        )
+    
+    def parse_openai_response(self, content: str, damage_results: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn an OpenAI JSON-mode cost reply into an estimate dict"""
+        return self.validate_openai_response(orjson.loads(content), damage_results)
+    
+    def response_cache_key(self, damage_results: Dict[str, Any]) -> tuple:
+        """Cache key for an OpenAI estimate; results differing only in minor confidence jitter share one"""
+        return (
+            damage_results.get('vehicle_type', 'Car'),
+            damage_results.get('damage_type', 'Scratch'),
+            _SEVERITY_MAP.get(damage_results.get('severity', 'Moderate'), 'Moderate'),
+            round(damage_results.get('confidence', 0.5), 1),
+            damage_results.get('location', 'Mumbai').lower()
+        )
     
     def get_openai_cost_estimate(self, damage_results: Dict[str, Any]) -> Dict[str, Any]:
         """Get cost estimate using OpenAI AI for realistic Indian pricing"""
@@ -225,58 +385,12 @@ class EnhancedCostEstimator:
             return self.get_fallback_cost_estimate(damage_results)
         
         try:
-            vehicle_type = damage_results.get('vehicle_type', 'Car')
-            damage_type = damage_results.get('damage_type', 'Scratch')
-            raw_severity = damage_results.get('severity', 'Moderate')
-            severity = self.map_severity(raw_severity)
-            confidence = damage_results.get('confidence', 0.5)
-            location = damage_results.get('location', 'Mumbai')
+            key = self.response_cache_key(damage_results)
+            cached = response_cache().get(key)
+            if cached is not None:
+                return cached
             
-            prompt = f"""
-            As an expert automotive repair cost estimator in India, please provide a detailed cost breakdown for the following vehicle damage:
-
-            Vehicle Type: {vehicle_type}
-            Damage Type: {damage_type}
-            Severity: {severity}
-            Location: {location}
-            Confidence Level: {confidence:.2f}
-
-            Please provide a realistic cost estimate in Indian Rupees (INR) considering:
-            1. Current Indian market rates (2024)
-            2. Regional pricing variations
-            3. Labor costs in {location}
-            4. Parts availability and costs
-            5. GST (18%) and other taxes
-            6. Workshop overhead costs
-
-            Respond in the following JSON format:
-            {{
-                "total_cost": 0,
-                "cost_breakdown": {{
-                    "parts_cost": 0,
-                    "labor_cost": 0,
-                    "paint_cost": 0,
-                    "taxes_gst": 0,
-                    "overhead_cost": 0,
-                    "additional_costs": 0
-                }},
-                "repair_time_days": 0,
-                "complexity_level": "Simple/Moderate/Complex/Expert",
-                "market_analysis": {{
-                    "price_range": "Low/Medium/High/Premium",
-                    "availability": "Readily Available/Moderate/Scarce/Rare",
-                    "regional_factor": 1.0
-                }},
-                "recommendations": [
-                    "Specific repair recommendations",
-                    "Cost-saving tips",
-                    "Quality considerations"
-                ],
-                "confidence_score": 0.0
-            }}
-
-            Be realistic and consider Indian market conditions, local availability of parts, and regional labor costs.
-            """
+            prompt = self.build_cost_prompt(damage_results)
             
             response = self.client.chat.completions.create(
                 model="gpt-4o-mini",
@@ -284,28 +398,62 @@ class EnhancedCostEstimator:
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=1000,
-                temperature=0.3
+                temperature=0.3,
+                response_format={"type": "json_object"}
             )
             
             # Parse OpenAI response
-            try:
-                import re
-                content = response.choices[0].message.content
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(0)
-                    cost_data = json.loads(json_str)
-                    return self.validate_openai_response(cost_data, damage_results)
-                else:
-                    return self.parse_text_response(content, damage_results)
-            except Exception as e:
-                logger.error(f"Error parsing OpenAI response: {e}")
-                return self.parse_text_response(content, damage_results)
+            estimate = self.parse_openai_response(response.choices[0].message.content, damage_results)
+            response_cache().set(key, estimate, expire=RESPONSE_CACHE_TTL)
+            return estimate
                 
         except Exception as e:
             logger.error(f"Error getting OpenAI cost estimate: {e}")
             return self.get_fallback_cost_estimate(damage_results)
     
+    async def get_openai_cost_estimate_async(self, client: 'openai.AsyncOpenAI', semaphore: asyncio.Semaphore,
+                                             damage_results: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of get_openai_cost_estimate used by estimate_costs_batch"""
+        try:
+            key = self.response_cache_key(damage_results)
+            cached = response_cache().get(key)
+            if cached is not None:
+                return cached
+            
+            prompt = self.build_cost_prompt(damage_results)
+            
+            async with semaphore:
+                response = await client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=1000,
+                    temperature=0.3,
+                    response_format={"type": "json_object"}
+                )
+            
+            estimate = self.parse_openai_response(response.choices[0].message.content, damage_results)
+            response_cache().set(key, estimate, expire=RESPONSE_CACHE_TTL)
+            return estimate
+                
+        except Exception as e:
+            logger.error(f"Error getting OpenAI cost estimate: {e}")
+            return self.get_fallback_cost_estimate(damage_results)
+    
+    async def estimate_costs_batch(self, damage_results_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Estimate several repairs concurrently, at most MAX_CONCURRENT_REQUESTS in flight"""
+        if not self.openai_available:
+            return [self.get_fallback_cost_estimate(dr) for dr in damage_results_list]
+        
+        from models.openai_client import new_async_openai_client
+        
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        async with new_async_openai_client(self.openai_api_key) as client:
+            return list(await asyncio.gather(
+                *(self.get_openai_cost_estimate_async(client, semaphore, dr) for dr in damage_results_list)
+            ))
+    
     def validate_openai_response(self, cost_data: Dict[str, Any], damage_results: Dict[str, Any]) -> Dict[str, Any]:
         """Validate and clean OpenAI response"""
         try:
@@ -340,71 +488,20 @@ class EnhancedCostEstimator:
             logger.error(f"Error validating Gemini response: {e}")
             return self.get_fallback_cost_estimate(damage_results)
     
-    def parse_text_response(self, text: str, damage_results: Dict[str, Any]) -> Dict[str, Any]:
-        """Parse text response when JSON parsing fails"""
-        # Extract numbers from text
-        import re
-        numbers = re.findall(r'\d+', text)
-        
-        # Estimate costs based on text content
-        total_cost = 5000  # Default
-        if numbers:
-            # Try to find the largest number as total cost
-            total_cost = max([int(n) for n in numbers if int(n) > 100])
-        
-        return {
-            "total_cost": total_cost,
-            "cost_breakdown": {
-                "parts_cost": total_cost * 0.4,
-                "labor_cost": total_cost * 0.3,
-                "paint_cost": total_cost * 0.1,
-                "taxes_gst": total_cost * 0.15,
-                "overhead_cost": total_cost * 0.05,
-                "additional_costs": 0
-            },
-            "repair_time_days": 3,
-            "complexity_level": "Moderate",
-            "market_analysis": {
-                "price_range": "Medium",
-                "availability": "Moderate",
-                "regional_factor": 1.0
-            },
-            "recommendations": ["Get multiple quotes", "Check warranty", "Verify parts quality"],
-            "confidence_score": 0.6,
-            "source": "Gemini AI (Text Parse)",
-            "timestamp": datetime.now().isoformat()
-        }
-    
     def map_severity(self, severity: str) -> str:
         """Map model severity format to cost estimator format"""
-        severity_mapping = {
-            '01-minor': 'Minor',
-            '02-moderate': 'Moderate', 
-            '03-severe': 'Severe',
-            'minor': 'Minor',
-            'moderate': 'Moderate',
-            'severe': 'Severe',
-            'Minor': 'Minor',
-            'Moderate': 'Moderate',
-            'Severe': 'Severe'
-        }
-        return severity_mapping.get(severity, 'Moderate')
+        return _SEVERITY_MAP.get(severity, 'Moderate')
 
-    def get_fallback_cost_estimate(self, damage_results: Dict[str, Any]) -> Dict[str, Any]:
-        """Get fallback cost estimate using base pricing"""
-        vehicle_type = damage_results.get('vehicle_type', 'Car')
-        damage_type = damage_results.get('damage_type', 'Scratch')
-        raw_severity = damage_results.get('severity', 'Moderate')
-        severity = self.map_severity(raw_severity)
-        confidence = damage_results.get('confidence', 0.5)
-        location = damage_results.get('location', 'Mumbai')
-        
+    @staticmethod
+    @functools.lru_cache(maxsize=2048)
+    def _fallback_core(vehicle_type: str, damage_type: str, severity: str, region: str) -> tuple:
+        """Compute base pricing figures for one vehicle/damage/severity/region combination"""
         # Get base costs
-        vehicle_info = self.base_costs['vehicle_types'].get(vehicle_type, 
-                                                           self.base_costs['vehicle_types']['Car'])
-        damage_info = self.base_costs['damage_types'].get(damage_type, 
-                                                         self.base_costs['damage_types']['Scratch'])
-        severity_multiplier = self.base_costs['severity_multipliers'].get(severity, 1.0)
+        vehicle_info = _BASE_COSTS['vehicle_types'].get(vehicle_type, 
+                                                        _BASE_COSTS['vehicle_types']['Car'])
+        damage_info = _BASE_COSTS['damage_types'].get(damage_type, 
+                                                      _BASE_COSTS['damage_types']['Scratch'])
+        severity_multiplier = _BASE_COSTS['severity_multipliers'].get(severity, 1.0)
         
         # Calculate costs
         parts_cost = damage_info['parts_cost'] * vehicle_info['parts_multiplier'] * severity_multiplier
@@ -412,11 +509,10 @@ class EnhancedCostEstimator:
         labor_cost = labor_hours * vehicle_info['base_labor_rate'] * vehicle_info['complexity_factor']
         
         # Apply regional factor
-        region = self.get_region_classification(location)
-        regional_factor = self.base_costs['indian_market_factors'].get(region, 1.0)
+        regional_factor = _BASE_COSTS['indian_market_factors'].get(region, 1.0)
         
         # Calculate additional costs
-        paint_cost = damage_info.get('paint_cost', 0) if 'paint' in damage_type.lower() else 0
+        paint_cost = damage_info.get('paint_cost', 0) if damage_type in _PAINT_DAMAGE_TYPES else 0
         taxes_gst = (parts_cost + labor_cost + paint_cost) * 0.18  # 18% GST
         overhead_cost = (parts_cost + labor_cost) * 0.1  # 10% overhead
         
@@ -424,17 +520,41 @@ class EnhancedCostEstimator:
         total_before_tax = (parts_cost + labor_cost + paint_cost + overhead_cost) * regional_factor
         total_cost = total_before_tax + taxes_gst
         
+        return (
+            total_cost,
+            round(parts_cost * regional_factor, 2),
+            round(labor_cost * regional_factor, 2),
+            round(paint_cost * regional_factor, 2),
+            round(taxes_gst, 2),
+            round(overhead_cost * regional_factor, 2),
+            max(1, int(damage_info['labor_hours'] * severity_multiplier / 8)),
+            regional_factor
+        )
+
+    def get_fallback_cost_estimate(self, damage_results: Dict[str, Any]) -> Dict[str, Any]:
+        """Get fallback cost estimate using base pricing"""
+        vehicle_type = damage_results.get('vehicle_type', 'Car')
+        damage_type = damage_results.get('damage_type', 'Scratch')
+        raw_severity = damage_results.get('severity', 'Moderate')
+        severity = _SEVERITY_MAP.get(raw_severity, 'Moderate')
+        confidence = damage_results.get('confidence', 0.5)
+        location = damage_results.get('location', 'Mumbai')
+        
+        region = self.get_region_classification(location)
+        (total_cost, parts_cost, labor_cost, paint_cost, taxes_gst, overhead_cost,
+         repair_days, regional_factor) = self._fallback_core(vehicle_type, damage_type, severity, region)
+        
         return {
             "total_cost": round(total_cost, 2),
             "cost_breakdown": {
-                "parts_cost": round(parts_cost * regional_factor, 2),
-                "labor_cost": round(labor_cost * regional_factor, 2),
-                "paint_cost": round(paint_cost * regional_factor, 2),
-                "taxes_gst": round(taxes_gst, 2),
-                "overhead_cost": round(overhead_cost * regional_factor, 2),
+                "parts_cost": parts_cost,
+                "labor_cost": labor_cost,
+                "paint_cost": paint_cost,
+                "taxes_gst": taxes_gst,
+                "overhead_cost": overhead_cost,
                 "additional_costs": 0
             },
-            "repair_time_days": max(1, int(damage_info['labor_hours'] * severity_multiplier / 8)),
+            "repair_time_days": repair_days,
             "complexity_level": self.get_complexity_level(severity, damage_type),
             "market_analysis": {
                 "price_range": self.get_price_range(total_cost),
@@ -447,10 +567,37 @@ class EnhancedCostEstimator:
             "timestamp": datetime.now().isoformat()
         }
     
+    def encode_fallback_inputs(self, damage_results_list: List[Dict[str, Any]]) -> tuple:
+        """Encode damage results as (vehicle, damage, severity, region) code arrays for estimate_costs_vectorized"""
+        vehicle_codes, damage_codes, sev_codes, region_codes = [], [], [], []
+        for damage_results in damage_results_list:
+            vehicle_codes.append(_VEHICLE_CODES.get(damage_results.get('vehicle_type', 'Car'), _VEHICLE_CODES['Car']))
+            damage_codes.append(_DAMAGE_CODES.get(damage_results.get('damage_type', 'Scratch'), _DAMAGE_CODES['Scratch']))
+            severity = _SEVERITY_MAP.get(damage_results.get('severity', 'Moderate'), 'Moderate')
+            sev_codes.append(_SEVERITY_CODES[severity])
+            region = self.get_region_classification(damage_results.get('location', 'Mumbai'))
+            region_codes.append(_REGION_CODES[region])
+        return (np.array(vehicle_codes, dtype=np.intp), np.array(damage_codes, dtype=np.intp),
+                np.array(sev_codes, dtype=np.intp), np.array(region_codes, dtype=np.intp))
+    
+    def estimate_costs_vectorized(self, vehicle_codes: np.ndarray, damage_codes: np.ndarray,
+                                  sev_codes: np.ndarray, region_codes: np.ndarray) -> np.ndarray:
+        """Unrounded fallback total_cost for a whole batch of encoded rows at once"""
+        severity_multiplier = _SEV_MULT[sev_codes]
+        parts_cost = _DAMAGE_PARTS[damage_codes] * _VEHICLE_PARTS_MULT[vehicle_codes] * severity_multiplier
+        labor_cost = (_DAMAGE_LABOR_HOURS[damage_codes] * severity_multiplier
+                      * _VEHICLE_LABOR_RATE[vehicle_codes] * _VEHICLE_COMPLEXITY[vehicle_codes])
+        paint_cost = _DAMAGE_PAINT[damage_codes]
+        
+        taxes_gst = (parts_cost + labor_cost + paint_cost) * 0.18  # 18% GST
+        overhead_cost = (parts_cost + labor_cost) * 0.1  # 10% overhead
+        
+        return (parts_cost + labor_cost + paint_cost + overhead_cost) * _REGION_FACTOR[region_codes] + taxes_gst
+    
     def get_region_classification(self, location: str) -> str:
         """Get region classification for location"""
         location_lower = location.lower()
-        for city, region in self.indian_regions.items():
+        for city, region in _CITY_REGIONS:
             if city in location_lower:
                 return region
         return "tier1_cities"  # Default
@@ -479,35 +626,24 @@ class EnhancedCostEstimator:
     
     def generate_recommendations(self, vehicle_type: str, damage_type: str, severity: str, cost: float) -> List[str]:
         """Generate repair recommendations"""
-        recommendations = []
-        
-        # Basic recommendations
-        recommendations.append("Get quotes from at least 3 different workshops")
-        recommendations.append("Check for insurance coverage before proceeding")
-        
-        # Cost-specific recommendations
-        if cost > 10000:
-            recommendations.append("Consider filing an insurance claim")
-            recommendations.append("Verify workshop is insurance-approved")
-        
-        # Severity-specific recommendations
-        if severity in ["Severe", "Critical"]:
-            recommendations.append("Get a detailed inspection before repair")
-            recommendations.append("Consider OEM parts for better quality")
-        
-        # Damage-specific recommendations
-        if damage_type in ["Paint Damage", "Scratch"]:
-            recommendations.append("Ask about paint matching guarantee")
-        
+        return list(self._recommendations_for(vehicle_type, damage_type, severity, cost > 10000))
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _recommendations_for(vehicle_type: str, damage_type: str, severity: str, high_cost: bool) -> tuple:
+        """Recommendation tuple for one combination; fully determined by its arguments"""
+        recommendations = list(_BASE_RECS)
+        if high_cost:
+            recommendations.extend(_HIGH_COST_RECS)
+        if severity in _SEVERE_TYPES:
+            recommendations.extend(_SEVERE_RECS)
+        if damage_type in _PAINT_MATCH_TYPES:
+            recommendations.extend(_PAINT_MATCH_RECS)
         if damage_type == "Structural Damage":
-            recommendations.append("Ensure structural integrity is maintained")
-            recommendations.append("Get certification from authorized workshop")
-        
-        # Vehicle-specific recommendations
-        if vehicle_type in ["Truck", "Bus"]:
-            recommendations.append("Check for commercial vehicle insurance")
-        
-        return recommendations
+            recommendations.extend(_STRUCTURAL_RECS)
+        if vehicle_type in _HEAVY_VEHICLES:
+            recommendations.extend(_HEAVY_VEHICLE_RECS)
+        return tuple(recommendations)
     
     def estimate_cost(self, damage_results: Dict[str, Any]) -> Dict[str, Any]:
         """Main method to estimate repair cost"""
@@ -526,22 +662,11 @@ class EnhancedCostEstimator:
             return {"insights": "OpenAI AI not available for market insights"}
         
         try:
-            prompt = f"""
-            Provide current market insights for vehicle repair in India:
-
-            Vehicle Type: {vehicle_type}
-            Damage Type: {damage_type}
-            Location: {location}
-
-            Include:
-            1. Current market trends
-            2. Price fluctuations
-            3. Parts availability
-            4. Popular repair methods
-            5. Quality considerations
-
-            Keep it concise and relevant to Indian market.
-            """
+            prompt = _INSIGHTS_PROMPT_TMPL.format(
+                vehicle_type=vehicle_type,
+                damage_type=damage_type,
+                location=location
+            )
             
             response = self.model.generate_content(prompt)
             return {
@@ -553,13 +678,15 @@ class EnhancedCostEstimator:
             logger.error(f"Error getting market insights: {e}")
             return {"insights": "Unable to fetch market insights"}
 
-# Global instance
-enhanced_cost_estimator = EnhancedCostEstimator()
+@functools.cache
+def get_estimator() -> EnhancedCostEstimator:
+    """Shared estimator, built on first use rather than at import"""
+    return EnhancedCostEstimator()
 
 def estimate_repair_cost(damage_results: Dict[str, Any]) -> Dict[str, Any]:
     """Main function to estimate repair cost using enhanced estimator"""
     try:
-        return enhanced_cost_estimator.estimate_cost(damage_results)
+        return get_estimator().estimate_cost(damage_results)
     except Exception as e:
         logger.error(f"Error in enhanced cost estimation: {e}")
         return {
@@ -2,13 +2,24 @@
 Database models for the Vehicle Damage Assessment System
 """
 
+import threading
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from cachetools import TTLCache
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import make_transient_to_detached
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 
 db = SQLAlchemy()
 
+# Native JSON column; JSONB on PostgreSQL so documents can be indexed into
+JSONDocument = db.JSON().with_variant(JSONB(), 'postgresql')
+
+# Argon2id hashing runs in C; OWASP's interactive-login parameters (19 MiB, t=2)
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -16,20 +27,71 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(128))
     first_name = db.Column(db.String(50))
     last_name = db.Column(db.String(50))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=db.func.now())
     is_verified = db.Column(db.Boolean, default=False)
     is_admin = db.Column(db.Boolean, default=False)
     
     # Relationships
     damage_reports = db.relationship('DamageReport', backref='user', lazy=True)
     
+    # Timestamps are assigned by the database; fetch them back in the INSERT's RETURNING
+    __mapper_args__ = {'eager_defaults': True}
+    
     def set_password(self, password):
         """Set password hash"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Check password hash"""
-        return check_password_hash(self.password_hash, password)
+        """Check password hash, upgrading legacy or outdated hashes on success"""
+        if not self.password_hash:
+            return False
+        
+        # Accounts created before Argon2 still carry Werkzeug (pbkdf2/scrypt) hashes
+        if not self.password_hash.startswith('$argon2'):
+            from werkzeug.security import check_password_hash
+            if not check_password_hash(self.password_hash, password):
+                return False
+            self.set_password(password)
+            return True
+        
+        try:
+            password_hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        
+        if password_hasher.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
+
+# Detached snapshots of recently loaded users, so the login user loader
+# doesn't SELECT on every authenticated request
+_user_cache = TTLCache(maxsize=10000, ttl=30)
+_user_cache_lock = threading.Lock()
+
+def load_user_cached(user_id):
+    """Return the user attached to the current session, hitting the DB at most every 30s"""
+    with _user_cache_lock:
+        snapshot = _user_cache.get(user_id)
+    
+    if snapshot is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        # Cache a copy that never joins a session, so later commits can't expire it
+        snapshot = User(**{column.key: getattr(user, column.key) for column in User.__table__.columns})
+        make_transient_to_detached(snapshot)
+        with _user_cache_lock:
+            _user_cache[user_id] = snapshot
+        return user
+    
+    return db.session.merge(snapshot, load=False)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    """Drop a user's cached snapshot whenever the row changes"""
+    with _user_cache_lock:
+        _user_cache.pop(target.id, None)
 
 class DamageReport(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -39,32 +101,48 @@ class DamageReport(db.Model):
     severity = db.Column(db.String(20), nullable=False)
     estimated_cost = db.Column(db.Float)
     confidence_score = db.Column(db.Float)
-    image_paths = db.Column(db.Text)  # JSON string of image paths
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), default='pending')  # pending, approved, rejected
+    image_paths = db.Column(JSONDocument)  # List of image paths
+    created_at = db.Column(db.DateTime, default=db.func.now(), index=True)
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, approved, rejected
     
     # Additional fields for detailed reporting
     damage_description = db.Column(db.Text)
-    affected_areas = db.Column(db.Text)  # JSON string of affected areas
+    affected_areas = db.Column(JSONDocument)  # List of affected areas
     repair_urgency = db.Column(db.String(20))
     estimated_repair_complexity = db.Column(db.String(20))
     safety_concerns = db.Column(db.String(20))
     repair_time_days = db.Column(db.Integer)
-    cost_breakdown = db.Column(db.Text)  # JSON string of cost breakdown
-    recommendations = db.Column(db.Text)  # JSON string of recommendations
+    cost_breakdown = db.Column(JSONDocument)  # Cost breakdown dict
+    recommendations = db.Column(JSONDocument)  # List of recommendations
+    
+    # Serves "latest reports for a user" straight from the index, no sort step;
+    # its user_id prefix also covers plain user_id lookups
+    __table_args__ = (
+        db.Index('ix_report_user_created', 'user_id', 'created_at'),
+        db.Index('ix_report_affected_gin', 'affected_areas', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+    __mapper_args__ = {'eager_defaults': True}
     
     # Property to maintain backward compatibility
     @property
     def confidence(self):
         return self.confidence_score or 0.0
+    
+    @classmethod
+    def bulk_create(cls, rows):
+        """Insert many reports from plain dicts in one executemany, skipping per-row ORM objects"""
+        if not rows:
+            return
+        db.session.execute(db.insert(cls), rows)
+        db.session.commit()
 
 class RepairShop(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     address = db.Column(db.Text, nullable=False)
-    city = db.Column(db.String(100), nullable=False)
+    city = db.Column(db.String(100), nullable=False, index=True)
     state = db.Column(db.String(100), nullable=False)
-    pincode = db.Column(db.String(10), nullable=False)
+    pincode = db.Column(db.String(10), nullable=False, index=True)
     phone = db.Column(db.String(20), nullable=False)
     email = db.Column(db.String(120))
     latitude = db.Column(db.Float)
@@ -72,5 +150,26 @@ class RepairShop(db.Model):
     services = db.Column(db.Text)  # JSON string of services offered
     rating = db.Column(db.Float, default=0.0)
     is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+    
+    # Bounding-box prefilter for nearby-shop lookups
+    __table_args__ = (
+        db.Index('ix_shop_geo', 'latitude', 'longitude'),
+    )
+    __mapper_args__ = {'eager_defaults': True}
+
+class ShopBooking(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    shop_id = db.Column(db.Integer, nullable=False)
+    slot_datetime = db.Column(db.String(19), nullable=False)  # ISO start of the 1 hour slot
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    vehicle_info = db.Column(JSONDocument)
+    damage_info = db.Column(JSONDocument)
+    booked_at = db.Column(db.DateTime, default=db.func.now())
+    
+    # One booking per slot, enforced at INSERT so concurrent requests can't double-book;
+    # the same index serves "booked slots of a shop in a date range"
+    __table_args__ = (
+        db.UniqueConstraint('shop_id', 'slot_datetime', name='uq_booking_shop_slot'),
+    )
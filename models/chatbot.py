@@ -3,387 +3,461 @@ AI Chatbot/Assistant for Vehicle Damage Assessment System
 Provides real-time assistance for users during image upload and damage assessment
 """
 
+import functools
 import json
+import os
 import random
-from typing import Dict, List, Any
+import threading
+from collections import deque
+from cachetools import LRUCache
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, List, Any, Mapping
 import logging
+import ahocorasick
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bound once; both run on every chatbot turn
+_choice = random.choice
+_now = datetime.now
+
+# Messages kept per conversation (user and bot messages each count)
+CHAT_HISTORY_MAX = int(os.getenv('CHAT_HISTORY_MAX', '200'))
+# Conversations kept in memory; the least recently active user is evicted first
+CHAT_USERS_MAX = int(os.getenv('CHAT_USERS_MAX', '10000'))
+
+ANONYMOUS_USER = "_anon"
+
+# Keyword matches (intent and entities) by normalized message; they depend only on the message text.
+# Never mutated once stored
+_scan_cache = LRUCache(maxsize=1024)
+_scan_cache_lock = threading.Lock()
+
+# Predefined responses and conversation patterns, shared by every chatbot instance
+_RESPONSES: Dict[str, Any] = {
+    "greetings": (
+        "Hello! I'm here to help you with vehicle damage assessment. How can I assist you today?",
+        "Hi there! I can help you upload images and understand your damage assessment results. What do you need help with?",
+        "Welcome! I'm your AI assistant for damage assessment. Feel free to ask me anything!"
+    ),
+    "image_upload_help": (
+        "To get the best results, please upload clear, well-lit images of the damaged area from multiple angles.",
+        "Make sure the images show the damage clearly. Good lighting and multiple angles help our AI analyze better.",
+        "For best results, take photos during daylight and ensure the damaged area is clearly visible in the frame."
+    ),
+    "image_quality": (
+        "The image quality looks good! Our AI should be able to analyze this effectively.",
+        "The image is a bit blurry. Try taking another photo with better focus for more accurate results.",
+        "The lighting could be better. Try taking the photo in better lighting conditions."
+    ),
+    "damage_types": {
+        "dent": "A dent is a depression in the vehicle's surface, usually caused by impact. It can range from minor to severe.",
+        "scratch": "A scratch is a mark or groove on the surface, often caused by contact with rough objects or surfaces.",
+        "broken_part": "This refers to any component that has been damaged or separated from the vehicle structure.",
+        "crack": "A crack is a line of separation in the material, which can spread and cause further damage.",
+        "rust": "Rust is corrosion that occurs when metal is exposed to moisture and oxygen over time.",
+        "paint_damage": "Damage to the paint surface, including chips, fading, or peeling.",
+        "structural_damage": "Damage to the vehicle's structural components that affects its integrity.",
+        "glass_damage": "Damage to windows, windshields, or other glass components.",
+        "light_damage": "Damage to headlights, taillights, or other lighting components.",
+        "bumper_damage": "Damage specifically to the front or rear bumper of the vehicle."
+    },
+    "severity_explanations": {
+        "minor": "Minor damage typically involves cosmetic issues that can be repaired quickly and inexpensively.",
+        "moderate": "Moderate damage may require professional repair and could affect vehicle performance.",
+        "severe": "Severe damage requires immediate attention and may involve structural components.",
+        "critical": "Critical damage poses safety risks and requires immediate professional intervention."
+    },
+    "cost_estimation": (
+        "Our cost estimation is based on current market rates for parts and labor in your area.",
+        "The estimated cost includes parts, labor, and additional materials needed for repair.",
+        "Keep in mind that actual repair costs may vary depending on the specific repair shop and additional damage discovered."
+    ),
+    "next_steps": (
+        "Based on your assessment, I recommend contacting a certified repair shop for a detailed inspection.",
+        "You should consider filing an insurance claim if the estimated cost exceeds your deductible.",
+        "For minor damage, you might be able to handle some repairs yourself with the right tools and materials."
+    ),
+    "error_handling": (
+        "I'm sorry, I didn't understand that. Could you please rephrase your question?",
+        "I'm having trouble processing that request. Can you try asking in a different way?",
+        "I'm not sure about that. Let me connect you with a human support agent for more specific help."
+    ),
+    "farewell": (
+        "You're welcome! Feel free to ask if you have any other questions about your damage assessment.",
+        "Glad I could help! Don't hesitate to reach out if you need assistance with anything else.",
+        "Happy to assist! Let me know if you need help with your damage assessment or any other questions."
+    )
+}
+
+# Suggestion lists by reply kind, shared read-only by every reply
+_SUGGESTIONS: Dict[str, tuple] = {
+    "greeting": (
+        "How do I upload images?",
+        "What types of damage can you detect?",
+        "How accurate is the cost estimation?"
+    ),
+    "image_upload_help": (
+        "What image quality is best?",
+        "How many images should I upload?",
+        "Can I use my phone camera?"
+    ),
+    "damage_type": (
+        "How is severity determined?",
+        "What's the typical cost for this damage?",
+        "Should I get this repaired immediately?"
+    ),
+    "damage_type_clarification": (
+        "Dent",
+        "Scratch",
+        "Broken Part",
+        "Crack",
+        "Rust",
+        "Paint Damage"
+    ),
+    "severity": (
+        "What should I do for this severity?",
+        "How does severity affect cost?",
+        "Is this safe to drive?"
+    ),
+    "severity_overview": (
+        "Explain Minor damage",
+        "Explain Moderate damage",
+        "Explain Severe damage",
+        "Explain Critical damage"
+    ),
+    "cost_question": (
+        "How accurate is the cost estimate?",
+        "What factors affect the cost?",
+        "Should I get multiple estimates?"
+    ),
+    "next_steps": (
+        "Find nearby repair shops",
+        "Contact insurance company",
+        "Schedule inspection"
+    ),
+    "help": (
+        "How to upload images",
+        "Understanding damage types",
+        "Cost estimation process",
+        "Finding repair shops"
+    ),
+    "general": (
+        "How do I upload images?",
+        "What damage types can you detect?",
+        "How does cost estimation work?",
+        "Find repair shops near me"
+    ),
+    "no_context": (
+        "How do I upload images?",
+        "What damage types can you detect?",
+        "How accurate is the cost estimation?",
+        "Find repair shops near me"
+    ),
+    "has_images": (
+        "Analyze my images",
+        "What damage do you see?",
+        "Estimate repair cost",
+        "Find repair shops"
+    ),
+    "has_results": (
+        "Explain the damage type",
+        "Why is the cost so high?",
+        "Find repair shops",
+        "Download report"
+    ),
+    "error": (
+        "Try rephrasing your question",
+        "Contact support"
+    ),
+    "processing_error": (
+        "Try rephrasing your question",
+        "Contact support if the issue persists"
+    ),
+    "default_context": (
+        "Upload images for analysis",
+        "Learn about damage types",
+        "Understand cost estimation",
+        "Get repair recommendations"
+    )
+}
+
+def _frozen_reply(message: str, kind: str, suggestions: str = None) -> MappingProxyType:
+    """Read-only reply shared by every caller; suggestions name a _SUGGESTIONS entry, or none"""
+    return MappingProxyType({
+        "message": message,
+        "type": kind,
+        "suggestions": _SUGGESTIONS[suggestions] if suggestions else ()
+    })
+
+# Every reply the chatbot can give, built once; handlers pick one instead of assembling dicts
+_REPLIES: Dict[str, Any] = {
+    "greeting": tuple(_frozen_reply(m, "greeting", "greeting") for m in _RESPONSES["greetings"]),
+    "image_upload_help": tuple(_frozen_reply(m, "help", "image_upload_help") for m in _RESPONSES["image_upload_help"]),
+    "damage_type": {k: _frozen_reply(m, "information", "damage_type") for k, m in _RESPONSES["damage_types"].items()},
+    "damage_type_clarification": _frozen_reply(
+        "I can help explain different types of vehicle damage. Which specific type are you asking about?",
+        "clarification", "damage_type_clarification"
+    ),
+    "severity": {k: _frozen_reply(m, "information", "severity") for k, m in _RESPONSES["severity_explanations"].items()},
+    "severity_overview": _frozen_reply(
+        "Damage severity ranges from Minor to Critical. Minor damage is cosmetic, while Critical damage poses safety risks.",
+        "information", "severity_overview"
+    ),
+    "cost_question": tuple(_frozen_reply(m, "information", "cost_question") for m in _RESPONSES["cost_estimation"]),
+    "next_steps": tuple(_frozen_reply(m, "advice", "next_steps") for m in _RESPONSES["next_steps"]),
+    "help": _frozen_reply(
+        "I can help you with image upload, damage analysis, cost estimation, and repair recommendations. What specific area do you need help with?",
+        "help", "help"
+    ),
+    "farewell": tuple(_frozen_reply(m, "farewell") for m in _RESPONSES["farewell"]),
+    "error": tuple(_frozen_reply(m, "error", "error") for m in _RESPONSES["error_handling"]),
+    "processing_error": _frozen_reply("I'm sorry, I encountered an error. Please try again.", "error", "processing_error"),
+    "general": _frozen_reply(
+        "I'm here to help with vehicle damage assessment. You can ask me about uploading images, understanding damage types, cost estimation, or repair recommendations.",
+        "general", "general"
+    )
+}
+
+@functools.lru_cache(maxsize=8)
+def _suggest(has_context: bool, has_images: bool, has_results: bool) -> tuple:
+    """Contextual suggestions; only a handful of flag combinations exist"""
+    if not has_context:
+        return _SUGGESTIONS["no_context"]
+    if has_images:
+        return _SUGGESTIONS["has_images"]
+    if has_results:
+        return _SUGGESTIONS["has_results"]
+    return _SUGGESTIONS["default_context"]
+
+# Intent keywords, highest priority first
+INTENT_KEYWORDS = (
+    ("greeting", ("hello", "hi", "hey", "good morning", "good afternoon")),
+    ("image_upload_help", ("upload", "image", "photo", "picture", "camera")),
+    ("damage_type_question", ("dent", "scratch", "broken", "crack", "rust", "paint")),
+    ("severity_question", ("severity", "severe", "minor", "moderate", "critical")),
+    ("cost_question", ("cost", "price", "expensive", "cheap", "estimate")),
+    ("next_steps", ("next", "what should", "recommend", "advice")),
+    ("help", ("help", "assist", "support", "how to")),
+    ("farewell", ("bye", "goodbye", "thanks", "thank you")),
+)
+
+# Keyword -> damage type, earlier entries win
+DAMAGE_TYPE_KEYWORDS = (
+    ("dent", "dent"),
+    ("dents", "dent"),
+    ("dented", "dent"),
+    ("scratch", "scratch"),
+    ("scratches", "scratch"),
+    ("scratched", "scratch"),
+    ("broken", "broken_part"),
+    ("break", "broken_part"),
+    ("crack", "crack"),
+    ("cracks", "crack"),
+    ("cracked", "crack"),
+    ("rust", "rust"),
+    ("rusty", "rust"),
+    ("paint", "paint_damage"),
+    ("painted", "paint_damage"),
+    ("structural", "structural_damage"),
+    ("glass", "glass_damage"),
+    ("windshield", "glass_damage"),
+    ("light", "light_damage"),
+    ("headlight", "light_damage"),
+    ("bumper", "bumper_damage"),
+)
+
+# Keyword -> severity, earlier entries win
+SEVERITY_KEYWORDS = (
+    ("minor", "minor"),
+    ("small", "minor"),
+    ("light", "minor"),
+    ("moderate", "moderate"),
+    ("medium", "moderate"),
+    ("severe", "severe"),
+    ("serious", "severe"),
+    ("bad", "severe"),
+    ("critical", "critical"),
+    ("dangerous", "critical"),
+    ("urgent", "critical"),
+)
+
+def build_keyword_automaton() -> ahocorasick.Automaton:
+    """Aho-Corasick automaton tagging each keyword with (kind, rank, label) for every table it appears in"""
+    tags = {}
+    for rank, (intent, words) in enumerate(INTENT_KEYWORDS):
+        for word in words:
+            tags.setdefault(word, []).append(("intent", rank, intent))
+    for rank, (word, damage_type) in enumerate(DAMAGE_TYPE_KEYWORDS):
+        tags.setdefault(word, []).append(("damage_type", rank, damage_type))
+    for rank, (word, severity) in enumerate(SEVERITY_KEYWORDS):
+        tags.setdefault(word, []).append(("severity", rank, severity))
+    
+    automaton = ahocorasick.Automaton()
+    for word, word_tags in tags.items():
+        automaton.add_word(word, tuple(word_tags))
+    automaton.make_automaton()
+    return automaton
+
+_KEYWORD_AUTOMATON = build_keyword_automaton()
+
 class DamageAssessmentChatbot:
-    def __init__(self):
-        self.responses = self.load_responses()
-        self.context = {}
-        self.conversation_history = []
+    __slots__ = ("responses", "contexts", "conversation_history")
     
-    def load_responses(self) -> Dict[str, Any]:
-        """Load predefined responses and conversation patterns"""
-        return {
-            "greetings": [
-                "Hello! I'm here to help you with vehicle damage assessment. How can I assist you today?",
-                "Hi there! I can help you upload images and understand your damage assessment results. What do you need help with?",
-                "Welcome! I'm your AI assistant for damage assessment. Feel free to ask me anything!"
-            ],
-            "image_upload_help": [
-                "To get the best results, please upload clear, well-lit images of the damaged area from multiple angles.",
-                "Make sure the images show the damage clearly. Good lighting and multiple angles help our AI analyze better.",
-                "For best results, take photos during daylight and ensure the damaged area is clearly visible in the frame."
-            ],
-            "image_quality": [
-                "The image quality looks good! Our AI should be able to analyze this effectively.",
-                "The image is a bit blurry. Try taking another photo with better focus for more accurate results.",
-                "The lighting could be better. Try taking the photo in better lighting conditions."
-            ],
-            "damage_types": {
-                "dent": "A dent is a depression in the vehicle's surface, usually caused by impact. It can range from minor to severe.",
-                "scratch": "A scratch is a mark or groove on the surface, often caused by contact with rough objects or surfaces.",
-                "broken_part": "This refers to any component that has been damaged or separated from the vehicle structure.",
-                "crack": "A crack is a line of separation in the material, which can spread and cause further damage.",
-                "rust": "Rust is corrosion that occurs when metal is exposed to moisture and oxygen over time.",
-                "paint_damage": "Damage to the paint surface, including chips, fading, or peeling.",
-                "structural_damage": "Damage to the vehicle's structural components that affects its integrity.",
-                "glass_damage": "Damage to windows, windshields, or other glass components.",
-                "light_damage": "Damage to headlights, taillights, or other lighting components.",
-                "bumper_damage": "Damage specifically to the front or rear bumper of the vehicle."
-            },
-            "severity_explanations": {
-                "minor": "Minor damage typically involves cosmetic issues that can be repaired quickly and inexpensively.",
-                "moderate": "Moderate damage may require professional repair and could affect vehicle performance.",
-                "severe": "Severe damage requires immediate attention and may involve structural components.",
-                "critical": "Critical damage poses safety risks and requires immediate professional intervention."
-            },
-            "cost_estimation": [
-                "Our cost estimation is based on current market rates for parts and labor in your area.",
-                "The estimated cost includes parts, labor, and additional materials needed for repair.",
-                "Keep in mind that actual repair costs may vary depending on the specific repair shop and additional damage discovered."
-            ],
-            "next_steps": [
-                "Based on your assessment, I recommend contacting a certified repair shop for a detailed inspection.",
-                "You should consider filing an insurance claim if the estimated cost exceeds your deductible.",
-                "For minor damage, you might be able to handle some repairs yourself with the right tools and materials."
-            ],
-            "error_handling": [
-                "I'm sorry, I didn't understand that. Could you please rephrase your question?",
-                "I'm having trouble processing that request. Can you try asking in a different way?",
-                "I'm not sure about that. Let me connect you with a human support agent for more specific help."
-            ],
-            "farewell": [
-                "You're welcome! Feel free to ask if you have any other questions about your damage assessment.",
-                "Glad I could help! Don't hesitate to reach out if you need assistance with anything else.",
-                "Happy to assist! Let me know if you need help with your damage assessment or any other questions."
-            ]
-        }
+    def __init__(self):
+        self.responses = _RESPONSES
+        self.contexts = LRUCache(maxsize=CHAT_USERS_MAX)
+        self.conversation_history = LRUCache(maxsize=CHAT_USERS_MAX)
     
     def process_message(self, message: str, user_id: str = None, context: Dict = None) -> Dict[str, Any]:
         """Process user message and generate appropriate response"""
         try:
-            # Update context
+            # Merge into this user's context only
             if context:
-                self.context.update(context)
+                self.context_for(user_id).update(context)
             
-            # Add to conversation history
-            self.conversation_history.append({
-                "user": message,
-                "timestamp": self.get_timestamp()
-            })
+            timestamp = self.get_timestamp()
             
-            # Analyze message intent
-            intent = self.analyze_intent(message)
+            # Repeated questions skip the keyword scan; the reply variant is still drawn per turn
+            key = message.strip().lower()
+            with _scan_cache_lock:
+                matches = _scan_cache.get(key)
+            
+            if matches is None:
+                # One keyword scan gives the intent and the entities the reply needs
+                matches = self.scan_keywords(message)
+                with _scan_cache_lock:
+                    _scan_cache[key] = matches
+            intent = matches.get("intent", "general")
             
             # Generate response based on intent
-            response = self.generate_response(intent, message, user_id)
+            response = dict(self.generate_response(intent, message, user_id, matches))
             
-            # Add response to history
-            self.conversation_history.append({
-                "bot": response["message"],
-                "timestamp": self.get_timestamp()
-            })
+            # One (timestamp, user message, bot reply) record per turn
+            self.history_for(user_id).append((timestamp, message, response["message"]))
             
             return response
             
         except Exception as e:
-            logger.error(f"Error processing message: {e}")
-            return {
-                "message": "I'm sorry, I encountered an error. Please try again.",
-                "type": "error",
-                "suggestions": ["Try rephrasing your question", "Contact support if the issue persists"]
-            }
+            logger.error("Error processing message: %s", e)
+            return dict(_REPLIES["processing_error"])
+    
+    def scan_keywords(self, message: str) -> Dict[str, str]:
+        """Match every keyword in one pass; returns the winning intent, damage_type and severity found"""
+        best = {}
+        for _, tags in _KEYWORD_AUTOMATON.iter(message.lower()):
+            for kind, rank, label in tags:
+                if kind not in best or rank < best[kind][0]:
+                    best[kind] = (rank, label)
+        
+        return {kind: label for kind, (rank, label) in best.items()}
     
     def analyze_intent(self, message: str) -> str:
         """Analyze user message to determine intent"""
-        message_lower = message.lower()
-        
-        # Greeting patterns
-        if any(word in message_lower for word in ["hello", "hi", "hey", "good morning", "good afternoon"]):
-            return "greeting"
-        
-        # Image upload help
-        if any(word in message_lower for word in ["upload", "image", "photo", "picture", "camera"]):
-            return "image_upload_help"
-        
-        # Damage type questions
-        if any(word in message_lower for word in ["dent", "scratch", "broken", "crack", "rust", "paint"]):
-            return "damage_type_question"
-        
-        # Severity questions
-        if any(word in message_lower for word in ["severity", "severe", "minor", "moderate", "critical"]):
-            return "severity_question"
-        
-        # Cost questions
-        if any(word in message_lower for word in ["cost", "price", "expensive", "cheap", "estimate"]):
-            return "cost_question"
-        
-        # Next steps
-        if any(word in message_lower for word in ["next", "what should", "recommend", "advice"]):
-            return "next_steps"
-        
-        # Help requests
-        if any(word in message_lower for word in ["help", "assist", "support", "how to"]):
-            return "help"
-        
-        # Farewell
-        if any(word in message_lower for word in ["bye", "goodbye", "thanks", "thank you"]):
-            return "farewell"
-        
-        return "general"
+        return self.scan_keywords(message).get("intent", "general")
     
-    def generate_response(self, intent: str, message: str, user_id: str = None) -> Dict[str, Any]:
-        """Generate response based on intent and context"""
+    def generate_response(self, intent: str, message: str, user_id: str = None,
+                          matches: Dict[str, str] = None) -> Mapping[str, Any]:
+        """Generate response based on intent; the returned mapping is shared and read-only"""
         try:
-            if intent == "greeting":
-                return {
-                    "message": random.choice(self.responses["greetings"]),
-                    "type": "greeting",
-                    "suggestions": [
-                        "How do I upload images?",
-                        "What types of damage can you detect?",
-                        "How accurate is the cost estimation?"
-                    ]
-                }
-            
-            elif intent == "image_upload_help":
-                return {
-                    "message": random.choice(self.responses["image_upload_help"]),
-                    "type": "help",
-                    "suggestions": [
-                        "What image quality is best?",
-                        "How many images should I upload?",
-                        "Can I use my phone camera?"
-                    ]
-                }
-            
-            elif intent == "damage_type_question":
-                damage_type = self.extract_damage_type(message)
-                if damage_type and damage_type in self.responses["damage_types"]:
-                    return {
-                        "message": self.responses["damage_types"][damage_type],
-                        "type": "information",
-                        "suggestions": [
-                            "How is severity determined?",
-                            "What's the typical cost for this damage?",
-                            "Should I get this repaired immediately?"
-                        ]
-                    }
-                else:
-                    return {
-                        "message": "I can help explain different types of vehicle damage. Which specific type are you asking about?",
-                        "type": "clarification",
-                        "suggestions": [
-                            "Dent", "Scratch", "Broken Part", "Crack", "Rust", "Paint Damage"
-                        ]
-                    }
-            
-            elif intent == "severity_question":
-                severity = self.extract_severity(message)
-                if severity and severity in self.responses["severity_explanations"]:
-                    return {
-                        "message": self.responses["severity_explanations"][severity],
-                        "type": "information",
-                        "suggestions": [
-                            "What should I do for this severity?",
-                            "How does severity affect cost?",
-                            "Is this safe to drive?"
-                        ]
-                    }
-                else:
-                    return {
-                        "message": "Damage severity ranges from Minor to Critical. Minor damage is cosmetic, while Critical damage poses safety risks.",
-                        "type": "information",
-                        "suggestions": [
-                            "Explain Minor damage",
-                            "Explain Moderate damage", 
-                            "Explain Severe damage",
-                            "Explain Critical damage"
-                        ]
-                    }
-            
-            elif intent == "cost_question":
-                return {
-                    "message": random.choice(self.responses["cost_estimation"]),
-                    "type": "information",
-                    "suggestions": [
-                        "How accurate is the cost estimate?",
-                        "What factors affect the cost?",
-                        "Should I get multiple estimates?"
-                    ]
-                }
-            
-            elif intent == "next_steps":
-                return {
-                    "message": random.choice(self.responses["next_steps"]),
-                    "type": "advice",
-                    "suggestions": [
-                        "Find nearby repair shops",
-                        "Contact insurance company",
-                        "Schedule inspection"
-                    ]
-                }
-            
-            elif intent == "help":
-                return {
-                    "message": "I can help you with image upload, damage analysis, cost estimation, and repair recommendations. What specific area do you need help with?",
-                    "type": "help",
-                    "suggestions": [
-                        "How to upload images",
-                        "Understanding damage types",
-                        "Cost estimation process",
-                        "Finding repair shops"
-                    ]
-                }
-            
-            elif intent == "farewell":
-                return {
-                    "message": random.choice(self.responses["farewell"]),
-                    "type": "farewell",
-                    "suggestions": []
-                }
-            
-            else:
-                return {
-                    "message": "I'm here to help with vehicle damage assessment. You can ask me about uploading images, understanding damage types, cost estimation, or repair recommendations.",
-                    "type": "general",
-                    "suggestions": [
-                        "How do I upload images?",
-                        "What damage types can you detect?",
-                        "How does cost estimation work?",
-                        "Find repair shops near me"
-                    ]
-                }
+            if matches is None:
+                matches = self.scan_keywords(message)
+            handler = self._INTENT_HANDLERS.get(intent, DamageAssessmentChatbot._general_reply)
+            return handler(self, matches)
         
         except Exception as e:
-            logger.error(f"Error generating response: {e}")
-            return {
-                "message": random.choice(self.responses["error_handling"]),
-                "type": "error",
-                "suggestions": ["Try rephrasing your question", "Contact support"]
-            }
+            logger.error("Error generating response: %s", e)
+            return _choice(_REPLIES["error"])
+    
+    def _greeting_reply(self, matches: Dict[str, str]) -> Mapping[str, Any]:
+        return _choice(_REPLIES["greeting"])
+    
+    def _upload_help_reply(self, matches: Dict[str, str]) -> Mapping[str, Any]:
+        return _choice(_REPLIES["image_upload_help"])
+    
+    def _damage_type_reply(self, matches: Dict[str, str]) -> Mapping[str, Any]:
+        reply = _REPLIES["damage_type"].get(matches.get("damage_type"))
+        return reply or _REPLIES["damage_type_clarification"]
+    
+    def _severity_reply(self, matches: Dict[str, str]) -> Mapping[str, Any]:
+        reply = _REPLIES["severity"].get(matches.get("severity"))
+        return reply or _REPLIES["severity_overview"]
+    
+    def _cost_reply(self, matches: Dict[str, str]) -> Mapping[str, Any]:
+        return _choice(_REPLIES["cost_question"])
+    
+    def _next_steps_reply(self, matches: Dict[str, str]) -> Mapping[str, Any]:
+        return _choice(_REPLIES["next_steps"])
+    
+    def _help_reply(self, matches: Dict[str, str]) -> Mapping[str, Any]:
+        return _REPLIES["help"]
+    
+    def _farewell_reply(self, matches: Dict[str, str]) -> Mapping[str, Any]:
+        return _choice(_REPLIES["farewell"])
+    
+    def _general_reply(self, matches: Dict[str, str]) -> Mapping[str, Any]:
+        return _REPLIES["general"]
+    
+    # Intent -> reply builder; unknown intents get the general reply
+    _INTENT_HANDLERS = {
+        "greeting": _greeting_reply,
+        "image_upload_help": _upload_help_reply,
+        "damage_type_question": _damage_type_reply,
+        "severity_question": _severity_reply,
+        "cost_question": _cost_reply,
+        "next_steps": _next_steps_reply,
+        "help": _help_reply,
+        "farewell": _farewell_reply,
+    }
     
     def extract_damage_type(self, message: str) -> str:
         """Extract damage type from message"""
-        message_lower = message.lower()
-        
-        damage_mapping = {
-            "dent": "dent",
-            "dents": "dent",
-            "dented": "dent",
-            "scratch": "scratch",
-            "scratches": "scratch",
-            "scratched": "scratch",
-            "broken": "broken_part",
-            "break": "broken_part",
-            "crack": "crack",
-            "cracks": "crack",
-            "cracked": "crack",
-            "rust": "rust",
-            "rusty": "rust",
-            "paint": "paint_damage",
-            "painted": "paint_damage",
-            "structural": "structural_damage",
-            "glass": "glass_damage",
-            "windshield": "glass_damage",
-            "light": "light_damage",
-            "headlight": "light_damage",
-            "bumper": "bumper_damage"
-        }
-        
-        for keyword, damage_type in damage_mapping.items():
-            if keyword in message_lower:
-                return damage_type
-        
-        return None
+        return self.scan_keywords(message).get("damage_type")
     
     def extract_severity(self, message: str) -> str:
         """Extract severity level from message"""
-        message_lower = message.lower()
-        
-        severity_mapping = {
-            "minor": "minor",
-            "small": "minor",
-            "light": "minor",
-            "moderate": "moderate",
-            "medium": "moderate",
-            "severe": "severe",
-            "serious": "severe",
-            "bad": "severe",
-            "critical": "critical",
-            "dangerous": "critical",
-            "urgent": "critical"
-        }
-        
-        for keyword, severity in severity_mapping.items():
-            if keyword in message_lower:
-                return severity
-        
-        return None
+        return self.scan_keywords(message).get("severity")
     
     def get_timestamp(self) -> str:
         """Get current timestamp"""
-        from datetime import datetime
-        return datetime.now().isoformat()
+        return _now().isoformat()
+    
+    def history_for(self, user_id: str = None) -> deque:
+        """Return the user's (timestamp, message, reply) deque, creating it on first message"""
+        uid = user_id or ANONYMOUS_USER
+        history = self.conversation_history.get(uid)
+        if history is None:
+            history = self.conversation_history[uid] = deque(maxlen=max(1, CHAT_HISTORY_MAX // 2))
+        return history
+    
+    def context_for(self, user_id: str = None) -> Dict:
+        """Return the user's context dict, creating it on first use"""
+        uid = user_id or ANONYMOUS_USER
+        context = self.contexts.get(uid)
+        if context is None:
+            context = self.contexts[uid] = {}
+        return context
     
     def get_conversation_history(self, user_id: str = None) -> List[Dict]:
-        """Get conversation history for user"""
-        if user_id:
-            # Filter history by user_id if needed
-            return self.conversation_history
-        return self.conversation_history
+        """Get conversation history for user as alternating user/bot message dicts"""
+        history = []
+        for timestamp, user_message, bot_message in self.conversation_history.get(user_id or ANONYMOUS_USER, ()):
+            history.append({"user": user_message, "timestamp": timestamp})
+            history.append({"bot": bot_message, "timestamp": timestamp})
+        return history
     
     def clear_history(self, user_id: str = None):
-        """Clear conversation history"""
-        self.conversation_history = []
-        self.context = {}
+        """Clear one user's conversation history and context, or everyone's when no user is given"""
+        if user_id is None:
+            self.conversation_history.clear()
+            self.contexts.clear()
+        else:
+            self.conversation_history.pop(user_id, None)
+            self.contexts.pop(user_id, None)
     
     def get_suggestions(self, context: Dict = None) -> List[str]:
         """Get contextual suggestions based on current state"""
         if not context:
-            return [
-                "How do I upload images?",
-                "What damage types can you detect?",
-                "How accurate is the cost estimation?",
-                "Find repair shops near me"
-            ]
-        
-        # Context-based suggestions
-        if context.get("has_images"):
-            return [
-                "Analyze my images",
-                "What damage do you see?",
-                "Estimate repair cost",
-                "Find repair shops"
-            ]
-        
-        if context.get("has_results"):
-            return [
-                "Explain the damage type",
-                "Why is the cost so high?",
-                "Find repair shops",
-                "Download report"
-            ]
-        
-        return [
-            "Upload images for analysis",
-            "Learn about damage types",
-            "Understand cost estimation",
-            "Get repair recommendations"
-        ]
+            return list(_suggest(False, False, False))
+        return list(_suggest(True, bool(context.get("has_images")), bool(context.get("has_results"))))
@@ -4,16 +4,86 @@ Combines OpenAI AI analysis with severity-only ML model for optimal accuracy
 """
 
 import os
+import hashlib
+import functools
 import logging
-from typing import List, Dict, Any
-from .openai_damage_analyzer import detect_damage_with_openai
-from .severity_inference import ImprovedSeverityModel
+import threading
+from cachetools import LRUCache
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from .openai_damage_analyzer import analysis_deadline, detect_damage_with_openai
+from .severity_inference import ImprovedSeverityModel, file_digest
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# OpenAI calls run here while the severity model works in the request thread
+_openai_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='openai-analysis')
+
+# Detection results by image content, so re-uploads of the same photos skip both models
+_result_cache = LRUCache(maxsize=256)
+_result_cache_lock = threading.Lock()
+
+
+def hash_images(image_paths: List[str]) -> bytes:
+    """BLAKE2b digest over the contents of the images, in order"""
+    combined = hashlib.blake2b(digest_size=16)
+    for path in image_paths:
+        combined.update(file_digest(path))
+    return combined.digest()
+
+
+def detach_paths(result: Dict[str, Any], image_paths: List[str]) -> Dict[str, Any]:
+    """Copy of result whose per-image details refer to positions in image_paths instead of upload paths"""
+    detached = dict(result)
+    if 'severity_details' in result:
+        details, start = [], 0
+        for d in result['severity_details']:
+            # Details follow image_paths order, skipping images that could not be scored
+            start = image_paths.index(d['path'], start)
+            details.append({'index': start, 'pred': d['pred'], 'conf': d['conf']})
+            start += 1
+        detached['severity_details'] = details
+    return detached
+
+
+def attach_paths(cached: Dict[str, Any], image_paths: List[str]) -> Dict[str, Any]:
+    """Rebuild a cached result for this request's image_paths"""
+    result = dict(cached)
+    if 'severity_details' in cached:
+        result['severity_details'] = [{'path': image_paths[d['index']], 'pred': d['pred'], 'conf': d['conf']}
+                                      for d in cached['severity_details']]
+    return result
+
+
+def cached_detection(kind: str, detect):
+    """Wrap a detector returning (result, complete) so identical image sets reuse the last complete result"""
+    @functools.wraps(detect)
+    def wrapper(image_paths):
+        try:
+            key = (kind, hash_images(image_paths))
+        except (OSError, TypeError) as e:
+            logger.warning("Could not hash images, skipping result cache: %s", e)
+            return detect(image_paths)[0]
+        
+        with _result_cache_lock:
+            cached = _result_cache.get(key)
+        if cached is not None:
+            return attach_paths(cached, image_paths)
+        
+        # Degraded results (errors, fallbacks, OpenAI outages) are recomputed on the next upload
+        result, complete = detect(image_paths)
+        if complete:
+            # Identical photos may come from another user's upload, so upload paths never enter the cache
+            detached = detach_paths(result, image_paths)
+            with _result_cache_lock:
+                _result_cache[key] = detached
+        return result
+    return wrapper
+
 
 class HybridDamageDetector:
+    __slots__ = ('openai_available', 'severity_model')
+
     def __init__(self):
         self.openai_available = os.getenv('OPENAI_API_KEY') is not None
         self.severity_model = None
@@ -21,23 +91,42 @@ class HybridDamageDetector:
         try:
             if os.path.exists(os.path.join(model_dir, 'voting_model.pkl')):
                 self.severity_model = ImprovedSeverityModel(model_dir)
-                logger.info(f"Loaded severity model from {model_dir}")
+                logger.info("Loaded severity model from %s", model_dir)
             else:
                 logger.warning("Severity model artifacts not found; severity will be estimated via Gemini if available")
         except Exception as e:
-            logger.error(f"Failed to load severity model: {e}")
+            logger.error("Failed to load severity model: %s", e)
 
     def analyze_images(self, image_paths: List[str]) -> Dict[str, Any]:
+        return self.analyze_images_checked(image_paths)[0]
+
+    def analyze_images_checked(self, image_paths: List[str]) -> Tuple[Dict[str, Any], bool]:
+        """analyze_images, plus whether the result includes a real OpenAI analysis"""
+        # OpenAI is network-bound and the severity model is local CPU work, so overlap them
+        openai_future = _openai_pool.submit(detect_damage_with_openai, image_paths) if self.openai_available else None
+        sev = self.severity_model.predict_severity(image_paths) if self.severity_model else None
+        
+        openai_result = None
+        if openai_future is not None:
+            try:
+                # Wait as long as the client itself may take, so a timed-out wait never leaves the call running
+                openai_result = openai_future.result(timeout=analysis_deadline(len(image_paths)))
+            except Exception as e:
+                logger.error("OpenAI analysis failed, using severity only: %s", e)
+        complete = openai_result is not None and openai_result.get('analysis_method') == 'openai'
+        return self.merge_results(image_paths, sev, openai_result), complete
+
+    def merge_results(self, image_paths: List[str], sev: Optional[Dict[str, Any]],
+                      openai_result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Combine severity model and OpenAI outputs into one detection result"""
         result: Dict[str, Any] = {}
         # Severity via local model if available
-        if self.severity_model:
-            sev = self.severity_model.predict_severity(image_paths)
+        if sev is not None:
             result['severity'] = sev['severity']
             result['severity_confidence'] = sev['confidence']
             result['severity_details'] = sev['details']
         # Damage type via OpenAI if available
-        if self.openai_available:
-            openai_result = detect_damage_with_openai(image_paths)
+        if openai_result is not None:
             result['vehicle_type'] = openai_result.get('vehicle_type', 'Car')
             result['damage_type'] = openai_result.get('damage_type', 'Unknown')
             result['damage_description'] = openai_result.get('damage_description')
@@ -57,14 +146,14 @@ class HybridDamageDetector:
         return result
 
 
-
 hybrid_detector = HybridDamageDetector()
 
+@functools.partial(cached_detection, 'hybrid')
 def detect_damage_hybrid(image_paths):
     try:
-        return hybrid_detector.analyze_images(image_paths)
+        return hybrid_detector.analyze_images_checked(image_paths)
     except Exception as e:
-        logger.error(f"Hybrid detection error: {e}")
+        logger.error("Hybrid detection error: %s", e)
         return {
             'vehicle_type': 'Car',
             'damage_type': 'Unknown',
@@ -72,8 +161,9 @@ def detect_damage_hybrid(image_paths):
             'confidence': 0.5,
             'total_images': len(image_paths) if image_paths else 0,
             'analysis_method': 'error'
-        }
+        }, False
 
+@functools.partial(cached_detection, 'simple')
 def detect_damage_simple(image_paths):
     """Simple damage detection using only severity model"""
     try:
@@ -85,7 +175,7 @@ def detect_damage_simple(image_paths):
                 'confidence': 0.5,
                 'total_images': 0,
                 'analysis_method': 'severity-only'
-            }
+            }, True
         
         # Use only severity model for simple detection
         if hybrid_detector.severity_model:
@@ -98,7 +188,7 @@ def detect_damage_simple(image_paths):
                 'total_images': len(image_paths),
                 'analysis_method': 'severity-only',
                 'severity_details': sev['details']
-            }
+            }, True
         else:
             # Fallback if no model available
             return {
@@ -108,9 +198,9 @@ def detect_damage_simple(image_paths):
                 'confidence': 0.5,
                 'total_images': len(image_paths),
                 'analysis_method': 'fallback'
-            }
+            }, False
     except Exception as e:
-        logger.error(f"Simple detection error: {e}")
+        logger.error("Simple detection error: %s", e)
         return {
             'vehicle_type': 'Car',
             'damage_type': 'Unknown',
@@ -118,4 +208,4 @@ def detect_damage_simple(image_paths):
             'confidence': 0.5,
             'total_images': len(image_paths) if image_paths else 0,
             'analysis_method': 'error'
-        }
+        }, False
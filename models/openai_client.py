@@ -0,0 +1,61 @@
+"""
+Shared OpenAI client for the damage analyzer and cost estimator
+All outbound OpenAI calls in a process share one HTTP/2 connection pool
+"""
+
+import atexit
+import functools
+import os
+import httpx
+import openai
+
+# Keep-alive pool sized for a worker serving many concurrent requests
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+# Vision calls with several images can take tens of seconds; fail well before the SDK's 10 minute default
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+# Retries per call, set explicitly so CALL_DEADLINE stays a true bound
+MAX_RETRIES = 2
+# The SDK sleeps up to 8s between attempts, or up to 60s when the server sends Retry-After
+MAX_RETRY_WAIT = 60.0
+# Longest one API call can take: every attempt runs into the timeout, with the longest wait before each retry
+CALL_DEADLINE = (HTTP_TIMEOUT.connect + HTTP_TIMEOUT.read) * (MAX_RETRIES + 1) + MAX_RETRY_WAIT * MAX_RETRIES
+
+
+@functools.lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    """Process-wide HTTP/2 client; concurrent requests multiplex over one connection"""
+    return httpx.Client(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+
+
+@functools.lru_cache(maxsize=None)
+def get_openai_client(api_key: str) -> openai.OpenAI:
+    """Return the OpenAI client for api_key, built once on top of the shared HTTP client"""
+    return openai.OpenAI(api_key=api_key, http_client=get_http_client(), timeout=HTTP_TIMEOUT,
+                         max_retries=MAX_RETRIES)
+
+
+def new_async_openai_client(api_key: str) -> openai.AsyncOpenAI:
+    """Build an AsyncOpenAI client for one event loop; use it as an async context manager so it is closed with the loop"""
+    return openai.AsyncOpenAI(
+        api_key=api_key,
+        http_client=httpx.AsyncClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT),
+        timeout=HTTP_TIMEOUT,
+        max_retries=MAX_RETRIES
+    )
+
+
+def close_clients():
+    """Close this process's pooled connections, if any were opened"""
+    if get_http_client.cache_info().currsize:
+        get_http_client().close()
+
+
+def _forget_clients_after_fork():
+    # A forked worker must not share the parent's sockets; it builds its own pool on first use
+    get_openai_client.cache_clear()
+    get_http_client.cache_clear()
+
+
+atexit.register(close_clients)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_clients_after_fork)
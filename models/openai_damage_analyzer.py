@@ -4,26 +4,147 @@ Replaces Gemini AI with OpenAI API for better availability and performance
 """
 
 import os
+import math
+import time
+import asyncio
 import base64
-import json
+import io
 import logging
-from typing import Dict, Any, List
-import openai
+import re
+import threading
+import orjson
+from cachetools import LRUCache
+from PIL import Image, ImageOps
+from typing import Dict, Any, List, Optional, BinaryIO
 from datetime import datetime
+from .openai_client import CALL_DEADLINE, get_openai_client, new_async_openai_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_ANALYSIS_FIELDS = """\
+{
+    "vehicle_type": "Car/SUV/Truck/Motorcycle",
+    "damage_type": "Scratch/Dent/Paint Damage/Bumper Damage/Broken Part/Major Collision/Structural Damage",
+    "damage_description": "Detailed description of the damage",
+    "severity": "Minor/Moderate/Severe",
+    "affected_areas": ["List of affected body parts"],
+    "repair_urgency": "Low/Medium/High",
+    "estimated_repair_complexity": "Simple/Moderate/Complex",
+    "safety_concerns": "None/Minor/Major",
+    "confidence": 0.0-1.0
+}"""
+
+_ANALYSIS_PROMPT = f"""\
+Analyze this vehicle damage image and provide a detailed assessment.
+
+Respond with ONLY a JSON object containing:
+{_ANALYSIS_FIELDS}
+
+Focus on Indian market context and realistic assessment."""
+
+# Several photos of the same vehicle in one request; one assessment per photo, in order
+_GROUP_PROMPT_TMPL = f"""\
+Analyze these {{count}} vehicle damage images of the same vehicle and provide a detailed assessment of each.
+
+Respond with ONLY a JSON object of the form {{{{"assessments": [...]}}}}, with exactly {{count}} entries in the same order as the images, each containing:
+{_ANALYSIS_FIELDS.replace('{', '{{').replace('}', '}}')}
+
+Focus on Indian market context and realistic assessment."""
+
+# Text half of every analysis message, shared by all requests (a plain dict so it serializes); only the image part is built per call
+_PROMPT_PART = {"type": "text", "text": _ANALYSIS_PROMPT}
+
+# Accepted values and fallback for each categorical field of an analysis
+_VALID_FIELDS = {
+    'vehicle_type': (frozenset({'Car', 'SUV', 'Truck', 'Motorcycle', 'Van', 'Bus'}), 'Car'),
+    'damage_type': (frozenset({
+        'Scratch', 'Dent', 'Paint Damage', 'Bumper Damage', 'Broken Part',
+        'Major Collision', 'Structural Damage', 'Minor Dent', 'Surface Damage',
+        'Panel Damage', 'Total Loss'
+    }), 'Unknown'),
+    'severity': (frozenset({'Minor', 'Moderate', 'Severe'}), 'Moderate'),
+}
+
+# "field: value" pairs in a reply that is not valid JSON; later occurrences win
+_FIELD_RE = re.compile(r'(vehicle_type|damage_type|severity|confidence)"?\s*[:=]\s*"?([^"\n,}]+)', re.IGNORECASE)
+
+# Raw bytes read per base64 step; a multiple of 3 so chunk encodings concatenate without padding
+ENCODE_CHUNK_SIZE = 57 * 1024
+
+# Longest edge sent to the vision model; larger photos cost more tokens without improving the assessment
+MAX_IMAGE_EDGE = 1024
+
+# Encoded images by (path, mtime, size), bounded by total encoded bytes so retries and re-analysis skip disk and encoding
+ENCODED_CACHE_BYTES = int(os.getenv('ENCODED_IMAGE_CACHE_MB', '64')) * 1024 * 1024
+_encoded_cache = LRUCache(maxsize=ENCODED_CACHE_BYTES, getsizeof=len)
+_encoded_cache_lock = threading.Lock()
+
+# Upper bound on vision calls in flight for one multi-image assessment
+MAX_CONCURRENT_REQUESTS = 8
+# Photos sent together in one vision call. Fewer requests per assessment, but the model writes each
+# group's assessments one after another, so larger groups trade latency for request-rate headroom
+IMAGES_PER_REQUEST = max(1, int(os.getenv('OPENAI_IMAGES_PER_REQUEST', '4')))
+
+# Allowance for reading and encoding the photos before the first call goes out
+ENCODE_ALLOWANCE = 10.0
+
+def analysis_deadline(image_count: int) -> float:
+    """Longest analyze_damage can take for image_count photos; groups beyond MAX_CONCURRENT_REQUESTS wait for a free slot"""
+    groups = math.ceil(image_count / IMAGES_PER_REQUEST)
+    return ENCODE_ALLOWANCE + CALL_DEADLINE * max(1, math.ceil(groups / MAX_CONCURRENT_REQUESTS))
+
+# Orderings used when merging per-image analyses; higher is worse
+SEVERITY_RANK = {'Minor': 0, 'Moderate': 1, 'Severe': 2}
+URGENCY_RANK = {'Low': 0, 'Medium': 1, 'High': 2}
+COMPLEXITY_RANK = {'Simple': 0, 'Moderate': 1, 'Complex': 2}
+SAFETY_RANK = {'None': 0, 'Minor': 1, 'Major': 2}
+
+# encode_for_vision only ever yields JPEG bytes, so every image goes out under this one prefix
+JPEG_DATA_URL_PREFIX = b'data:image/jpeg;base64,'
+
+def encode_stream(f: BinaryIO, size: int) -> str:
+    """JPEG data URL of a stream, base64 encoded in 3-byte-aligned chunks into one preallocated buffer"""
+    start = len(JPEG_DATA_URL_PREFIX)
+    encoded = bytearray(start + (size + 2) // 3 * 4)
+    encoded[:start] = JPEG_DATA_URL_PREFIX
+    pos = start
+    for chunk in iter(lambda: f.read(ENCODE_CHUNK_SIZE), b''):
+        piece = base64.b64encode(chunk)
+        encoded[pos:pos + len(piece)] = piece
+        pos += len(piece)
+    del encoded[pos:]
+    return encoded.decode('ascii')
+
+def encode_file(path: str, size: int) -> str:
+    """JPEG data URL of a file on disk"""
+    with open(path, "rb", buffering=1 << 20) as f:
+        return encode_stream(f, size)
+
+def encode_for_vision(path: str, size: int) -> str:
+    """JPEG data URL of the image with its long edge capped at MAX_IMAGE_EDGE; small JPEGs are sent as-is"""
+    with Image.open(path) as img:
+        if img.format == 'JPEG' and max(img.size) <= MAX_IMAGE_EDGE:
+            return encode_file(path, size)
+        # Let the JPEG decoder scale down by a power of two before the exact resize
+        img.draft('RGB', (MAX_IMAGE_EDGE, MAX_IMAGE_EDGE))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((MAX_IMAGE_EDGE, MAX_IMAGE_EDGE), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.convert('RGB').save(buf, 'JPEG', quality=85, optimize=True)
+    size = buf.tell()
+    buf.seek(0)
+    return encode_stream(buf, size)
+
 class OpenAIDamageAnalyzer:
     def __init__(self, api_key: str = None):
         """Initialize OpenAI damage analyzer"""
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
-        self.client = None
         self.available = False
         
         if self.api_key:
             try:
-                self.client = openai.OpenAI(api_key=self.api_key)
+                get_openai_client(self.api_key)
                 self.available = True
                 logger.info("OpenAI damage analyzer initialized successfully")
             except Exception as e:
@@ -33,155 +154,193 @@ class OpenAIDamageAnalyzer:
             logger.warning("No OpenAI API key provided")
             self.available = False
     
+    @property
+    def client(self):
+        """Shared OpenAI client, looked up on each use so a forked worker gets its own connection pool"""
+        return get_openai_client(self.api_key) if self.available else None
+    
     def encode_image(self, image_path: str) -> str:
-        """Encode image to base64 for OpenAI API"""
+        """Encode image as a base64 data URL for OpenAI API"""
         try:
-            with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
+            st = os.stat(image_path)
+            key = (image_path, st.st_mtime_ns, st.st_size)
+            with _encoded_cache_lock:
+                cached = _encoded_cache.get(key)
+            if cached is not None:
+                return cached
+            
+            encoded = encode_for_vision(image_path, st.st_size)
+            if len(encoded) <= _encoded_cache.maxsize:
+                with _encoded_cache_lock:
+                    _encoded_cache[key] = encoded
+            return encoded
         except Exception as e:
             logger.error(f"Error encoding image {image_path}: {e}")
             return None
     
+    def build_messages(self, image_url: str) -> List[Dict[str, Any]]:
+        """Chat messages asking for a JSON assessment of one image data URL"""
+        return [
+            {
+                "role": "user",
+                "content": [
+                    _PROMPT_PART,
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_url
+                        }
+                    }
+                ]
+            }
+        ]
+    
+    def build_group_messages(self, image_urls: List[str]) -> List[Dict[str, Any]]:
+        """Chat messages asking for one JSON assessment per image, all in a single request"""
+        content = [{"type": "text", "text": _GROUP_PROMPT_TMPL.format(count=len(image_urls))}]
+        content.extend({"type": "image_url", "image_url": {"url": url}} for url in image_urls)
+        return [{"role": "user", "content": content}]
+    
+    def parse_analysis(self, content: str) -> Dict[str, Any]:
+        """Turn the model's reply into a validated analysis dict"""
+        # JSON mode returns a bare object; text parsing only covers a malformed reply
+        try:
+            result = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            result = self.parse_text_response(content)
+        return self.analysis_from(result)
+    
+    def analysis_from(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Validated analysis dict from one decoded assessment object"""
+        # Ensure all required fields are present
+        result = self.validate_response(result)
+        
+        return {
+            'vehicle_type': result.get('vehicle_type', 'Car'),
+            'damage_type': result.get('damage_type', 'Unknown'),
+            'damage_description': result.get('damage_description', 'Damage detected'),
+            'severity': result.get('severity', 'Moderate'),
+            'affected_areas': result.get('affected_areas', []),
+            'repair_urgency': result.get('repair_urgency', 'Medium'),
+            'estimated_repair_complexity': result.get('estimated_repair_complexity', 'Moderate'),
+            'safety_concerns': result.get('safety_concerns', 'None'),
+            'confidence': float(result.get('confidence', 0.7)),
+            'analysis_method': 'openai',
+            'timestamp': datetime.now().isoformat()
+        }
+    
     def analyze_damage(self, image_paths: List[str]) -> Dict[str, Any]:
         """Analyze vehicle damage using OpenAI Vision API"""
         if not self.available or not image_paths:
             return self.get_fallback_analysis()
         
+        # Several photos are analyzed in grouped, concurrent requests and merged
+        if len(image_paths) > 1:
+            try:
+                return asyncio.run(self.analyze_damage_async(image_paths))
+            except Exception as e:
+                logger.error(f"OpenAI analysis error: {e}")
+                return self.get_fallback_analysis()
+        
         try:
-            # Use the first image for analysis
-            image_path = image_paths[0]
-            base64_image = self.encode_image(image_path)
+            image_url = self.encode_image(image_paths[0])
             
-            if not base64_image:
+            if not image_url:
                 return self.get_fallback_analysis()
             
             response = self.client.chat.completions.create(
                 model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": """Analyze this vehicle damage image and provide a detailed assessment. 
-                                
-                                Please respond with a JSON object containing:
-                                {
-                                    "vehicle_type": "Car/SUV/Truck/Motorcycle",
-                                    "damage_type": "Scratch/Dent/Paint Damage/Bumper Damage/Broken Part/Major Collision/Structural Damage",
-                                    "damage_description": "Detailed description of the damage",
-                                    "severity": "Minor/Moderate/Severe",
-                                    "affected_areas": ["List of affected body parts"],
-                                    "repair_urgency": "Low/Medium/High",
-                                    "estimated_repair_complexity": "Simple/Moderate/Complex",
-                                    "safety_concerns": "None/Minor/Major",
-                                    "confidence": 0.0-1.0
-                                }
-                                
-                                Focus on Indian market context and realistic assessment."""
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
+                messages=self.build_messages(image_url),
                 max_tokens=1000,
-                temperature=0.3
+                temperature=0.3,
+                response_format={"type": "json_object"}
             )
             
-            # Parse the response
-            content = response.choices[0].message.content
-            
-            # Try to extract JSON from the response
-            try:
-                # Look for JSON in the response
-                start_idx = content.find('{')
-                end_idx = content.rfind('}') + 1
-                if start_idx != -1 and end_idx != -1:
-                    json_str = content[start_idx:end_idx]
-                    result = json.loads(json_str)
-                else:
-                    # Fallback parsing
-                    result = self.parse_text_response(content)
-            except json.JSONDecodeError:
-                result = self.parse_text_response(content)
+            return self.parse_analysis(response.choices[0].message.content)
             
-            # Ensure all required fields are present
-            result = self.validate_response(result)
+        except Exception as e:
+            logger.error(f"OpenAI analysis error: {e}")
+            return self.get_fallback_analysis()
+    
+    async def analyze_group_async(self, client: 'openai.AsyncOpenAI', semaphore: asyncio.Semaphore,
+                                  image_paths: List[str]) -> List[Dict[str, Any]]:
+        """Analyze a group of images in one request; unreadable images are skipped, a failed request yields nothing"""
+        try:
+            encoded = await asyncio.gather(*(asyncio.to_thread(self.encode_image, p) for p in image_paths))
+            encoded = [b for b in encoded if b]
+            if not encoded:
+                return []
             
-            return {
-                'vehicle_type': result.get('vehicle_type', 'Car'),
-                'damage_type': result.get('damage_type', 'Unknown'),
-                'damage_description': result.get('damage_description', 'Damage detected'),
-                'severity': result.get('severity', 'Moderate'),
-                'affected_areas': result.get('affected_areas', []),
-                'repair_urgency': result.get('repair_urgency', 'Medium'),
-                'estimated_repair_complexity': result.get('estimated_repair_complexity', 'Moderate'),
-                'safety_concerns': result.get('safety_concerns', 'None'),
-                'confidence': float(result.get('confidence', 0.7)),
-                'analysis_method': 'openai',
-                'timestamp': datetime.now().isoformat()
-            }
+            single = len(encoded) == 1
+            async with semaphore:
+                response = await client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=self.build_messages(encoded[0]) if single else self.build_group_messages(encoded),
+                    max_tokens=1000 * len(encoded),
+                    temperature=0.3,
+                    response_format={"type": "json_object"}
+                )
+            content = response.choices[0].message.content
+            if single:
+                return [self.parse_analysis(content)]
+            assessments = orjson.loads(content).get('assessments') or []
+            return [self.analysis_from(a) for a in assessments if isinstance(a, dict)]
             
         except Exception as e:
-            logger.error(f"OpenAI analysis error: {e}")
+            logger.error(f"OpenAI analysis error for {image_paths}: {e}")
+            return []
+    
+    async def analyze_damage_async(self, image_paths: List[str]) -> Dict[str, Any]:
+        """Analyze images in groups of IMAGES_PER_REQUEST, groups concurrently with at most MAX_CONCURRENT_REQUESTS in flight, and merge the results"""
+        if not self.available or not image_paths:
+            return self.get_fallback_analysis()
+        
+        groups = [image_paths[i:i + IMAGES_PER_REQUEST] for i in range(0, len(image_paths), IMAGES_PER_REQUEST)]
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        async with new_async_openai_client(self.api_key) as client:
+            results = await asyncio.gather(
+                *(self.analyze_group_async(client, semaphore, group) for group in groups)
+            )
+        return self.merge_analyses([analysis for group in results for analysis in group])
+    
+    def merge_analyses(self, analyses: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Combine per-image analyses; the most severe image decides the damage, the rest add areas and risk"""
+        if not analyses:
             return self.get_fallback_analysis()
+        if len(analyses) == 1:
+            return analyses[0]
+        
+        primary = max(analyses, key=lambda a: (SEVERITY_RANK.get(a['severity'], 1), a['confidence']))
+        merged = dict(primary)
+        merged['affected_areas'] = list(dict.fromkeys(
+            area for a in analyses for area in (a.get('affected_areas') or [])
+        ))
+        for field, ranks in (('repair_urgency', URGENCY_RANK),
+                             ('estimated_repair_complexity', COMPLEXITY_RANK),
+                             ('safety_concerns', SAFETY_RANK)):
+            merged[field] = max((a[field] for a in analyses), key=lambda v: ranks.get(v, -1))
+        merged['confidence'] = sum(a['confidence'] for a in analyses) / len(analyses)
+        return merged
     
     def parse_text_response(self, content: str) -> Dict[str, Any]:
         """Parse text response when JSON parsing fails"""
-        result = {}
+        result = {key.lower(): value.strip() for key, value in _FIELD_RE.findall(content)}
         
-        # Simple text parsing
-        lines = content.split('\n')
-        for line in lines:
-            if 'vehicle_type' in line.lower():
-                result['vehicle_type'] = self.extract_value(line, 'Car')
-            elif 'damage_type' in line.lower():
-                result['damage_type'] = self.extract_value(line, 'Unknown')
-            elif 'severity' in line.lower():
-                result['severity'] = self.extract_value(line, 'Moderate')
-            elif 'confidence' in line.lower():
-                try:
-                    result['confidence'] = float(self.extract_value(line, '0.7'))
-                except:
-                    result['confidence'] = 0.7
+        if 'confidence' in result:
+            try:
+                result['confidence'] = float(result['confidence'].split()[0])
+            except (ValueError, IndexError):
+                result['confidence'] = 0.7
         
         return result
     
-    def extract_value(self, line: str, default: str) -> str:
-        """Extract value from a line of text"""
-        try:
-            # Look for colon separator
-            if ':' in line:
-                return line.split(':', 1)[1].strip().strip('"').strip("'")
-            return default
-        except:
-            return default
-    
     def validate_response(self, result: Dict[str, Any]) -> Dict[str, Any]:
         """Validate and fix the response"""
-        # Ensure vehicle_type is valid
-        valid_vehicles = ['Car', 'SUV', 'Truck', 'Motorcycle', 'Van', 'Bus']
-        if result.get('vehicle_type') not in valid_vehicles:
-            result['vehicle_type'] = 'Car'
-        
-        # Ensure damage_type is valid
-        valid_damage_types = [
-            'Scratch', 'Dent', 'Paint Damage', 'Bumper Damage', 'Broken Part',
-            'Major Collision', 'Structural Damage', 'Minor Dent', 'Surface Damage',
-            'Panel Damage', 'Total Loss'
-        ]
-        if result.get('damage_type') not in valid_damage_types:
-            result['damage_type'] = 'Unknown'
-        
-        # Ensure severity is valid
-        valid_severities = ['Minor', 'Moderate', 'Severe']
-        if result.get('severity') not in valid_severities:
-            result['severity'] = 'Moderate'
+        # Replace any category the model made up with its default
+        for field, (valid, default) in _VALID_FIELDS.items():
+            value = result.get(field)
+            if not isinstance(value, str) or value not in valid:
+                result[field] = default
         
         # Ensure confidence is between 0 and 1
         confidence = result.get('confidence', 0.7)
@@ -209,6 +368,82 @@ class OpenAIDamageAnalyzer:
             'timestamp': datetime.now().isoformat()
         }
 
+class BatchDamageAnalyzer:
+    """Offline analysis of many images through the OpenAI Batch API (half price, no per-minute request limits)"""
+    
+    TERMINAL_STATUSES = frozenset({'completed', 'failed', 'expired', 'cancelled'})
+    
+    def __init__(self, analyzer: OpenAIDamageAnalyzer):
+        self.analyzer = analyzer
+    
+    @property
+    def client(self):
+        return self.analyzer.client
+    
+    def build_jsonl(self, image_paths: List[str]) -> bytes:
+        """One chat.completions request per readable image, keyed by its path"""
+        lines = []
+        for path in dict.fromkeys(image_paths):
+            image_url = self.analyzer.encode_image(path)
+            if not image_url:
+                continue
+            lines.append(orjson.dumps({
+                "custom_id": path,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": "gpt-4o-mini",
+                    "messages": self.analyzer.build_messages(image_url),
+                    "max_tokens": 1000,
+                    "temperature": 0.3,
+                    "response_format": {"type": "json_object"}
+                }
+            }))
+        return b"\n".join(lines)
+    
+    def submit(self, image_paths: List[str]) -> str:
+        """Upload the request file and start a batch; returns the batch id"""
+        batch_file = self.client.files.create(file=("damage_batch.jsonl", self.build_jsonl(image_paths)), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        logger.info(f"Submitted damage analysis batch {batch.id}")
+        return batch.id
+    
+    def poll(self, batch_id: str, interval: float = 30.0):
+        """Block until the batch reaches a terminal status and return it"""
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in self.TERMINAL_STATUSES:
+                return batch
+            time.sleep(interval)
+    
+    def download(self, output_file_id: str) -> Dict[str, Dict[str, Any]]:
+        """Analyses by image path; images whose request failed get the fallback analysis"""
+        results = {}
+        for line in self.client.files.content(output_file_id).content.splitlines():
+            if not line.strip():
+                continue
+            record = orjson.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                logger.error(f"Batch analysis failed for {record.get('custom_id')}: {record.get('error')}")
+                results[record["custom_id"]] = self.analyzer.get_fallback_analysis()
+                continue
+            content = response["body"]["choices"][0]["message"]["content"]
+            results[record["custom_id"]] = self.analyzer.parse_analysis(content)
+        return results
+    
+    def run(self, image_paths: List[str], interval: float = 30.0) -> Dict[str, Dict[str, Any]]:
+        """Submit, wait for and collect a batch in one call"""
+        batch = self.poll(self.submit(image_paths), interval)
+        if batch.status != 'completed' or not batch.output_file_id:
+            logger.error(f"Damage analysis batch {batch.id} ended with status {batch.status}")
+            return {}
+        return self.download(batch.output_file_id)
+
 # Global instance
 openai_analyzer = OpenAIDamageAnalyzer()
 
@@ -1,5 +1,9 @@
+import math
 from datetime import datetime
 
+# Radius of earth in kilometers
+EARTH_RADIUS_KM = 6371
+
 # Import db from the main app when this module is imported
 def init_db(database):
     global db
@@ -24,8 +28,8 @@ class RepairShop:
     # Business details
     rating = db.Column(db.Float, default=0.0)
     price_range = db.Column(db.String(20))  # $, $$, $$$, $$$$
-    specialties = db.Column(db.Text)  # JSON string of specialties
-    working_hours = db.Column(db.Text)  # JSON string of working hours
+    specialties = db.Column(db.JSON)  # List of specialties, decoded on load
+    working_hours = db.Column(db.JSON)  # Working hours by day, decoded on load
     
     # Status
     is_active = db.Column(db.Boolean, default=True)
@@ -65,8 +69,6 @@ class RepairShop:
     @staticmethod
     def calculate_distance(lat1, lon1, lat2, lon2):
         """Calculate distance between two points using Haversine formula"""
-        import math
-        
         # Convert latitude and longitude from degrees to radians
         lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
         
@@ -76,10 +78,7 @@ class RepairShop:
         a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
         c = 2 * math.asin(math.sqrt(a))
         
-        # Radius of earth in kilometers
-        r = 6371
-        
-        return c * r
+        return c * EARTH_RADIUS_KM
     
     @classmethod
     def find_nearby_shops(cls, user_lat, user_lon, radius_km=10, limit=20):
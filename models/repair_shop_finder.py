@@ -5,21 +5,103 @@ Finds nearby repair shops and provides booking functionality
 
 import json
 import math
-from typing import List, Dict, Any, Optional
+import functools
+import numpy as np
+from typing import TYPE_CHECKING, List, Dict, Any, FrozenSet, Iterator, NamedTuple, Optional, Tuple
 import logging
 import requests
-from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from sqlalchemy.exc import IntegrityError
+from datetime import date as Date, datetime, timedelta
+from database_models import db, ShopBooking
+
+if TYPE_CHECKING:
+    from sklearn.neighbors import BallTree
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Mean radius of the earth in kilometers
+EARTH_RADIUS_KM = 6371
+# Bookable window: the next 30 days, hourly slots from 9 AM to 5 PM
+BOOKING_DAYS = 30
+BOOKING_HOURS = range(9, 17)
+
+# Lowercased services that qualify a shop for cars, and for each damage type
+CAR_SERVICES = frozenset({"body repair", "paint", "glass", "mechanical"})
+DAMAGE_SERVICES = {
+    "Dent": frozenset({"body repair", "paint"}),
+    "Scratch": frozenset({"paint", "detailing"}),
+    "Broken Part": frozenset({"body repair", "mechanical"}),
+    "Crack": frozenset({"body repair", "paint", "glass"}),
+    "Rust": frozenset({"body repair", "paint"}),
+    "Paint Damage": frozenset({"paint", "detailing"}),
+    "Structural Damage": frozenset({"body repair", "mechanical"}),
+    "Glass Damage": frozenset({"glass"}),
+    "Light Damage": frozenset({"body repair", "mechanical"}),
+    "Bumper Damage": frozenset({"body repair", "paint"})
+}
+
+@functools.cache
+def maps_session() -> requests.Session:
+    """Process-wide keep-alive session for Google Maps calls; finders are short-lived, the connections are not"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10,
+                          max_retries=Retry(total=2, backoff_factor=0.3))
+    session.mount("https://", adapter)
+    return session
+
+# Below this many shops a vectorized scan beats the BallTree's fixed per-query overhead (~40us)
+BALLTREE_MIN_SHOPS = 2048
+
+class ShopIndex(NamedTuple):
+    """Shop list with its lookup structures"""
+    shops: List[Dict[str, Any]]
+    by_id: Dict[int, Dict[str, Any]]
+    # Lowercased name, services and specialties per shop id for filtering and search
+    lowered: Dict[int, Tuple[str, FrozenSet[str], FrozenSet[str]]]
+    lat_rad: np.ndarray  # coordinates in radians, element i is shops[i]
+    lon_rad: np.ndarray
+    cos_lat: np.ndarray
+    tree: Optional['BallTree']  # haversine index, only for large shop lists
+
+@functools.cache
+def shop_index() -> ShopIndex:
+    """Process-wide shop index; finders are created per request, the index is built once"""
+    shops = RepairShopFinder.load_repair_shops()
+    coords = np.radians([[shop["latitude"], shop["longitude"]] for shop in shops])
+    tree = None
+    if len(shops) >= BALLTREE_MIN_SHOPS:
+        # sklearn is slow to import; only pay for it when the tree is actually built
+        from sklearn.neighbors import BallTree
+        tree = BallTree(coords, metric='haversine')
+    return ShopIndex(
+        shops=shops,
+        by_id={shop["id"]: shop for shop in shops},
+        lowered={
+            shop["id"]: (shop["name"].lower(),
+                         frozenset(s.lower() for s in shop.get("services", [])),
+                         frozenset(s.lower() for s in shop.get("specialties", [])))
+            for shop in shops
+        },
+        lat_rad=coords[:, 0].copy(),
+        lon_rad=coords[:, 1].copy(),
+        cos_lat=np.cos(coords[:, 0]),
+        tree=tree
+    )
+
 class RepairShopFinder:
     def __init__(self, google_maps_api_key: str = None):
         self.google_maps_api_key = google_maps_api_key
-        self.repair_shops = self.load_repair_shops()
-        self.booking_slots = self.initialize_booking_slots()
+        index = shop_index()
+        self.repair_shops = index.shops
+        self._by_id = index.by_id
+        self._lowered = index.lowered
+        self._index = index
     
-    def load_repair_shops(self) -> List[Dict[str, Any]]:
+    @staticmethod
+    def load_repair_shops() -> List[Dict[str, Any]]:
         """Load repair shops from database or API"""
         # Sample repair shops data
         return [
@@ -140,40 +222,49 @@ class RepairShopFinder:
             }
         ]
     
-    def initialize_booking_slots(self) -> Dict[int, List[Dict]]:
-        """Initialize booking slots for repair shops"""
-        slots = {}
-        for shop in self.repair_shops:
-            slots[shop["id"]] = self.generate_booking_slots(shop["id"])
-        return slots
-    
-    def generate_booking_slots(self, shop_id: int) -> List[Dict]:
-        """Generate available booking slots for a repair shop"""
-        slots = []
+    def iter_booking_slots(self, shop_id: int, date: str = None) -> Iterator[Dict]:
+        """Yield free booking slots for a repair shop over the next 30 days, or on one date"""
+        shop = self._by_id.get(shop_id)
+        if not shop:
+            return
+        
         start_date = datetime.now().date()
+        if date:
+            try:
+                day = Date.fromisoformat(date)
+            except ValueError:
+                return
+            if not 0 <= (day - start_date).days < BOOKING_DAYS:
+                return
+            days = [day]
+        else:
+            days = [start_date + timedelta(days=days_ahead) for days_ahead in range(BOOKING_DAYS)]
         
-        for days_ahead in range(30):  # Next 30 days
-            date = start_date + timedelta(days=days_ahead)
-            day_name = date.strftime("%A").lower()
-            
-            # Get shop hours for this day
-            shop = next((s for s in self.repair_shops if s["id"] == shop_id), None)
-            if not shop or shop["hours"][day_name] == "Closed":
+        # Only taken slots are stored; one indexed range query covers the whole window
+        booked = set(db.session.scalars(
+            db.select(ShopBooking.slot_datetime).where(
+                ShopBooking.shop_id == shop_id,
+                ShopBooking.slot_datetime >= days[0].isoformat(),
+                ShopBooking.slot_datetime < (days[-1] + timedelta(days=1)).isoformat()
+            )
+        ))
+        for day in days:
+            if shop["hours"][day.strftime("%A").lower()] == "Closed":
                 continue
             
-            # Generate time slots (every hour from 9 AM to 5 PM)
-            for hour in range(9, 17):
-                slot_time = datetime.combine(date, datetime.min.time().replace(hour=hour))
-                slots.append({
+            for hour in BOOKING_HOURS:
+                slot_time = datetime.combine(day, datetime.min.time().replace(hour=hour))
+                slot_datetime = slot_time.isoformat()
+                if slot_datetime in booked:
+                    continue
+                yield {
                     "shop_id": shop_id,
-                    "date": date.isoformat(),
+                    "date": day.isoformat(),
                     "time": slot_time.strftime("%H:%M"),
-                    "datetime": slot_time.isoformat(),
+                    "datetime": slot_datetime,
                     "available": True,
                     "duration": 60  # 1 hour slots
-                })
-        
-        return slots
+                }
     
     def find_nearby_shops(self, latitude: float, longitude: float, radius_km: float = 10.0, 
                          vehicle_type: str = None, damage_type: str = None) -> List[Dict[str, Any]]:
@@ -181,27 +272,26 @@ class RepairShopFinder:
         try:
             nearby_shops = []
             
-            for shop in self.repair_shops:
-                # Calculate distance
-                distance = self.calculate_distance(latitude, longitude, 
-                                                shop["latitude"], shop["longitude"])
-                
-                if distance <= radius_km:
-                    # Filter by vehicle type if specified
-                    if vehicle_type and not self.shop_supports_vehicle_type(shop, vehicle_type):
-                        continue
-                    
-                    # Filter by damage type if specified
-                    if damage_type and not self.shop_supports_damage_type(shop, damage_type):
-                        continue
-                    
-                    shop_info = shop.copy()
-                    shop_info["distance_km"] = round(distance, 2)
-                    shop_info["distance_miles"] = round(distance * 0.621371, 2)
-                    nearby_shops.append(shop_info)
+            # Shops within the radius, nearest first
+            indices, distances = self.shops_within(latitude, longitude, radius_km)
             
-            # Sort by distance
-            nearby_shops.sort(key=lambda x: x["distance_km"])
+            for i, distance in zip(indices.tolist(), distances.tolist()):
+                shop = self.repair_shops[i]
+                
+                # Filter by vehicle type if specified
+                if vehicle_type and not self.shop_supports_vehicle_type(shop, vehicle_type):
+                    continue
+                
+                # Filter by damage type if specified
+                if damage_type and not self.shop_supports_damage_type(shop, damage_type):
+                    continue
+                
+                # Shallow copy with the distances in one allocation; the list is already sorted by distance
+                nearby_shops.append({
+                    **shop,
+                    "distance_km": round(distance, 2),
+                    "distance_miles": round(distance * 0.621371, 2)
+                })
             
             return nearby_shops
             
@@ -209,6 +299,24 @@ class RepairShopFinder:
             logger.error(f"Error finding nearby shops: {e}")
             return []
     
+    def shops_within(self, latitude: float, longitude: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices into repair_shops within radius_km and their distances in km, nearest first"""
+        index = self._index
+        if index.tree is not None:
+            point = np.radians([[latitude, longitude]])
+            indices, angles = index.tree.query_radius(point, r=radius_km / EARTH_RADIUS_KM,
+                                                      return_distance=True, sort_results=True)
+            return indices[0], angles[0] * EARTH_RADIUS_KM
+        
+        # Haversine distance to every shop at once
+        lat, lon = math.radians(latitude), math.radians(longitude)
+        a = (np.sin((index.lat_rad - lat) / 2) ** 2
+             + index.cos_lat * math.cos(lat) * np.sin((index.lon_rad - lon) / 2) ** 2)
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+        indices = np.flatnonzero(distances <= radius_km)
+        indices = indices[np.argsort(distances[indices], kind='stable')]
+        return indices, distances[indices]
+    
     def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """Calculate distance between two points using Haversine formula"""
         try:
@@ -221,47 +329,36 @@ class RepairShopFinder:
             a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
             c = 2 * math.asin(math.sqrt(a))
             
-            # Radius of earth in kilometers
-            r = 6371
-            return c * r
+            return c * EARTH_RADIUS_KM
             
         except Exception as e:
             logger.error(f"Error calculating distance: {e}")
             return float('inf')
     
+    def shop_services(self, shop: Dict) -> FrozenSet[str]:
+        """Lowercased services offered by a shop"""
+        lowered = self._lowered.get(shop.get("id"))
+        if lowered is None:
+            return frozenset(service.lower() for service in shop.get("services", []))
+        return lowered[1]
+    
     def shop_supports_vehicle_type(self, shop: Dict, vehicle_type: str) -> bool:
         """Check if shop supports the given vehicle type - only supports cars"""
         # Only support cars, so check for car-related services
-        required_services = ["Body Repair", "Paint", "Glass", "Mechanical"]
-        shop_services = [service.lower() for service in shop.get("services", [])]
-        return any(service.lower() in shop_services for service in required_services)
+        return not CAR_SERVICES.isdisjoint(self.shop_services(shop))
     
     def shop_supports_damage_type(self, shop: Dict, damage_type: str) -> bool:
         """Check if shop supports the given damage type"""
-        damage_mapping = {
-            "Dent": ["Body Repair", "Paint"],
-            "Scratch": ["Paint", "Detailing"],
-            "Broken Part": ["Body Repair", "Mechanical"],
-            "Crack": ["Body Repair", "Paint", "Glass"],
-            "Rust": ["Body Repair", "Paint"],
-            "Paint Damage": ["Paint", "Detailing"],
-            "Structural Damage": ["Body Repair", "Mechanical"],
-            "Glass Damage": ["Glass"],
-            "Light Damage": ["Body Repair", "Mechanical"],
-            "Bumper Damage": ["Body Repair", "Paint"]
-        }
-        
-        required_services = damage_mapping.get(damage_type, [])
+        required_services = DAMAGE_SERVICES.get(damage_type)
         if not required_services:
             return True  # Assume support if no specific requirements
         
-        shop_services = [service.lower() for service in shop.get("services", [])]
-        return any(service.lower() in shop_services for service in required_services)
+        return not required_services.isdisjoint(self.shop_services(shop))
     
     def get_shop_details(self, shop_id: int) -> Optional[Dict[str, Any]]:
         """Get detailed information about a specific repair shop"""
         try:
-            shop = next((s for s in self.repair_shops if s["id"] == shop_id), None)
+            shop = self._by_id.get(shop_id)
             if not shop:
                 return None
             
@@ -280,15 +377,8 @@ class RepairShopFinder:
     def get_available_slots(self, shop_id: int, date: str = None) -> List[Dict]:
         """Get available booking slots for a repair shop"""
         try:
-            if date:
-                # Filter slots for specific date
-                return [slot for slot in self.booking_slots.get(shop_id, []) 
-                       if slot["date"] == date and slot["available"]]
-            else:
-                # Return all available slots
-                return [slot for slot in self.booking_slots.get(shop_id, []) 
-                       if slot["available"]]
-                
+            return list(self.iter_booking_slots(shop_id, date))
+            
         except Exception as e:
             logger.error(f"Error getting available slots: {e}")
             return []
@@ -297,9 +387,9 @@ class RepairShopFinder:
                         vehicle_info: Dict, damage_info: Dict) -> Dict[str, Any]:
         """Book an appointment with a repair shop"""
         try:
-            # Find the slot
-            slot = next((s for s in self.booking_slots.get(shop_id, []) 
-                        if s["datetime"] == slot_datetime and s["available"]), None)
+            # The slot must be one the shop offers and not yet taken
+            slot = next((s for s in self.iter_booking_slots(shop_id, slot_datetime[:10])
+                         if s["datetime"] == slot_datetime), None)
             
             if not slot:
                 return {
@@ -307,12 +397,22 @@ class RepairShopFinder:
                     "message": "Selected time slot is no longer available"
                 }
             
-            # Mark slot as booked
-            slot["available"] = False
-            slot["booked_by"] = user_id
-            slot["vehicle_info"] = vehicle_info
-            slot["damage_info"] = damage_info
-            slot["booking_time"] = datetime.now().isoformat()
+            # Mark slot as booked; the unique (shop, slot) index rejects a concurrent booking
+            db.session.add(ShopBooking(
+                shop_id=shop_id,
+                slot_datetime=slot_datetime,
+                user_id=user_id,
+                vehicle_info=vehicle_info,
+                damage_info=damage_info
+            ))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                return {
+                    "success": False,
+                    "message": "Selected time slot is no longer available"
+                }
             
             # Generate booking confirmation
             booking_id = f"BK{shop_id:03d}{int(datetime.now().timestamp())}"
@@ -330,6 +430,7 @@ class RepairShopFinder:
             }
             
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Error booking appointment: {e}")
             return {
                 "success": False,
@@ -381,11 +482,15 @@ class RepairShopFinder:
             results = []
             query_lower = query.lower()
             
+            if filters and "services" in filters:
+                required_services = frozenset(service.lower() for service in filters["services"])
+            
             for shop in self.repair_shops:
+                name, services, specialties = self._lowered[shop["id"]]
                 # Search in name, services, and specialties
-                if (query_lower in shop["name"].lower() or
-                    any(query_lower in service.lower() for service in shop["services"]) or
-                    any(query_lower in specialty.lower() for specialty in shop["specialties"])):
+                if (query_lower in name or
+                    any(query_lower in service for service in services) or
+                    any(query_lower in specialty for specialty in specialties)):
                     
                     # Apply filters if provided
                     if filters:
@@ -393,11 +498,8 @@ class RepairShopFinder:
                             continue
                         if "price_range" in filters and shop["price_range"] != filters["price_range"]:
                             continue
-                        if "services" in filters:
-                            required_services = filters["services"]
-                            shop_services = [s.lower() for s in shop["services"]]
-                            if not any(service.lower() in shop_services for service in required_services):
-                                continue
+                        if "services" in filters and required_services.isdisjoint(services):
+                            continue
                     
                     results.append(shop)
             
@@ -410,7 +512,7 @@ class RepairShopFinder:
     def get_directions(self, shop_id: int, user_latitude: float, user_longitude: float) -> Dict[str, Any]:
         """Get directions to a repair shop"""
         try:
-            shop = next((s for s in self.repair_shops if s["id"] == shop_id), None)
+            shop = self._by_id.get(shop_id)
             if not shop:
                 return {"error": "Shop not found"}
             
@@ -446,7 +548,7 @@ class RepairShopFinder:
                 "key": self.google_maps_api_key
             }
             
-            response = requests.get(url, params=params)
+            response = maps_session().get(url, params=params, timeout=(3, 10))
             response.raise_for_status()
             
             data = response.json()
@@ -1,10 +1,66 @@
 import os
+import math
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import numpy as np
 import joblib
 from PIL import Image
 import cv2
+from cachetools import LRUCache
+
+# Per-image (label, confidence) by (model dir, image content), shared by every model instance
+_prediction_cache = LRUCache(maxsize=512)
+_prediction_cache_lock = threading.Lock()
+
+# Feature vectors by image content; they do not depend on the model, so any model dir can reuse them
+_feature_cache = LRUCache(maxsize=1024)
+_feature_cache_lock = threading.Lock()
+
+# Decoding and OpenCV work release the GIL, so a multi-image request extracts features in parallel
+_feature_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix='severity-features')
+
+def file_digest(path: str) -> bytes:
+    """BLAKE2b digest of a file's contents"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+def vote_severity(details: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Confidence-weighted majority vote over per-image predictions"""
+    if not details:
+        return {
+            'severity': 'Minor',
+            'confidence': 0.33,
+            'details': []
+        }
+    
+    # Labels come back sorted from np.unique, so ties go to the first label alphabetically
+    labels, label_idx = np.unique([d['pred'] for d in details], return_inverse=True)
+    votes = np.bincount(label_idx, weights=[d['conf'] for d in details], minlength=len(labels))
+    
+    winner = int(votes.argmax())
+    majority = str(labels[winner])
+    total_confidence = votes.sum()
+    conf = votes[winner] / total_confidence if total_confidence > 0 else 0.5
+    
+    return {
+        'severity': majority,
+        'confidence': float(conf),
+        'details': details
+    }
+
+# Layout of the 144 model features. The training pipeline produced 199 values and kept the first 144,
+# so only the hue histogram and the first 9 saturation bins of the HSV block survive
+N_FEATURES = 144
+HSV_FEATURES = N_FEATURES - 96 - 4 - 1 - 2
+# Which of np.histogram's 32 bins over [0, 255] each 8-bit value lands in (255 joins the last bin)
+RGB_BIN_OF_VALUE = np.minimum(np.arange(256) * 32 // 255, 31)
+PIXEL_VALUES = np.arange(256)
 
 def extract_advanced_features(image_path: str) -> np.ndarray:
     """Extract advanced features for the improved model - simplified to match training"""
@@ -16,54 +72,61 @@ def extract_advanced_features(image_path: str) -> np.ndarray:
         # Resize to standard size
         img_resized = cv2.resize(img_array, (224, 224))
         
-        features = []
+        features = np.zeros(N_FEATURES)
         
-        # 1. Basic RGB histograms (reduced to match training)
+        # 1. Basic RGB histograms (reduced to match training), folded from exact 256-value counts
         for channel in range(3):
-            hist, _ = np.histogram(img_resized[:, :, channel], bins=32, range=(0, 255))
-            features.extend(hist)
+            counts = cv2.calcHist([img_resized], [channel], None, [256], [0, 256]).ravel()
+            features[channel * 32:(channel + 1) * 32] = np.bincount(RGB_BIN_OF_VALUE, weights=counts, minlength=32)
         
         # 2. Convert to grayscale
         gray = cv2.cvtColor(img_resized, cv2.COLOR_RGB2GRAY)
         
-        # 3. Basic texture features
-        features.extend([
-            np.mean(gray),
-            np.std(gray),
-            np.var(gray),
-            np.median(gray)
-        ])
+        # 3. Basic texture features, all from one 256-value histogram; integer sums keep them exact
+        counts = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+        n = gray.size
+        total = int(counts @ PIXEL_VALUES)
+        var = (n * int(counts @ PIXEL_VALUES ** 2) - total * total) / (n * n)
+        cumulative = np.cumsum(counts)
+        median = (np.searchsorted(cumulative, (n - 1) // 2, side='right')
+                  + np.searchsorted(cumulative, n // 2, side='right')) / 2
+        features[96:100] = total / n, math.sqrt(var), var, median
         
         # 4. Edge features
         edges = cv2.Canny(gray, 50, 150)
-        edge_density = np.sum(edges > 0) / (edges.shape[0] * edges.shape[1])
-        features.append(edge_density)
+        features[100] = cv2.countNonZero(edges) / edges.size
         
         # 5. Gradient features
-        grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-        grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-        gradient_magnitude = np.sqrt(grad_x**2 + grad_y**2)
-        features.extend([
-            np.mean(gradient_magnitude),
-            np.std(gradient_magnitude)
-        ])
+        grad_x = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+        grad_y = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+        mean, std = (v.item() for v in cv2.meanStdDev(cv2.magnitude(grad_x, grad_y)))
+        features[101:103] = mean, std
         
-        # 6. HSV features
+        # 6. HSV features: hue histogram, then the leading saturation bins
         hsv = cv2.cvtColor(img_resized, cv2.COLOR_RGB2HSV)
-        for i in range(3):
-            hist, _ = np.histogram(hsv[:, :, i], bins=32, range=(0, 256))
-            features.extend(hist)
-        
-        # Ensure we have exactly 144 features
-        features = features[:144]
-        while len(features) < 144:
-            features.append(0)
+        features[103:135] = cv2.calcHist([hsv], [0], None, [32], [0, 256]).ravel()
+        features[135:] = cv2.calcHist([hsv], [1], None, [32], [0, 256]).ravel()[:HSV_FEATURES - 32]
         
-        return np.array(features)
+        return features
         
     except Exception as e:
         print(f"Error processing {image_path}: {e}")
-        return np.zeros(144)  # Match the expected feature count from training
+        return np.zeros(N_FEATURES)  # Match the expected feature count from training
+
+def cached_features(image_path: str, digest: Optional[bytes]) -> np.ndarray:
+    """Features for an image, decoded and extracted only once per content while it stays in the LRU"""
+    if digest is None:
+        return extract_advanced_features(image_path)
+    with _feature_cache_lock:
+        features = _feature_cache.get(digest)
+    if features is None:
+        features = extract_advanced_features(image_path)
+        # All zeros means the image could not be processed; let a later call retry it
+        if features.any():
+            features.flags.writeable = False
+            with _feature_cache_lock:
+                _feature_cache[digest] = features
+    return features
 
 class ImprovedSeverityModel:
     def __init__(self, model_dir: str):
@@ -85,52 +148,62 @@ class ImprovedSeverityModel:
                 raise FileNotFoundError(f"No model found in {model_dir}")
 
     def predict_severity(self, image_paths: List[str]) -> Dict[str, Any]:
-        feats = []
-        ok_paths = []
+        # Images scored before (same content, same model) skip feature extraction and inference
+        keys = []
         for p in image_paths:
             try:
-                feat = extract_advanced_features(p)
-                if len(feat) > 0:
-                    feats.append(feat)
-                    ok_paths.append(p)
-            except Exception:
-                continue
-        
-        if not feats:
-            return {
-                'severity': 'Minor',
-                'confidence': 0.33,
-                'details': []
-            }
-        
-        X = np.vstack(feats)
-        Xs = self.scaler.transform(X)
+                keys.append((str(self.model_dir), file_digest(p)))
+            except OSError:
+                keys.append(None)
+        with _prediction_cache_lock:
+            known = {k: _prediction_cache[k] for k in keys if k is not None and k in _prediction_cache}
+        
+        misses = [(p, key) for p, key in zip(image_paths, keys) if key not in known]
+        miss_paths = [p for p, _ in misses]
+        miss_digests = [key[1] if key is not None else None for _, key in misses]
+        if len(misses) > 1:
+            extracted = list(_feature_pool.map(cached_features, miss_paths, miss_digests))
+        else:
+            extracted = list(map(cached_features, miss_paths, miss_digests))
         
-        # Get predictions and probabilities
-        if hasattr(self.model, 'predict_proba'):
-            proba = self.model.predict_proba(Xs)
-            idxs = proba.argmax(axis=1)
-            confidences = proba.max(axis=1)
+        feats = []
+        ok_paths = []
+        ok_keys = []
+        for (p, key), feat in zip(misses, extracted):
+            if len(feat) > 0:
+                feats.append(feat)
+                ok_paths.append(p)
+                ok_keys.append(key)
+        
+        if feats:
+            X = np.vstack(feats)
+            Xs = self.scaler.transform(X)
+            
+            # Get predictions and probabilities
+            if hasattr(self.model, 'predict_proba'):
+                proba = self.model.predict_proba(Xs)
+                idxs = proba.argmax(axis=1)
+                confidences = proba.max(axis=1)
+            else:
+                idxs = self.model.predict(Xs)
+                confidences = np.ones(len(idxs)) * 0.5
+            
+            preds = self.le.inverse_transform(idxs)
+            fresh = {p: (str(pr), float(cf)) for p, pr, cf in zip(ok_paths, preds, confidences)}
+            with _prediction_cache_lock:
+                for p, key in zip(ok_paths, ok_keys):
+                    if key is not None:
+                        _prediction_cache[key] = fresh[p]
         else:
-            idxs = self.model.predict(Xs)
-            confidences = np.ones(len(idxs)) * 0.5
+            fresh = {}
         
-        preds = self.le.inverse_transform(idxs)
+        details = []
+        for p, key in zip(image_paths, keys):
+            pred = known.get(key) if key is not None else None
+            if pred is None:
+                pred = fresh.get(p)
+            if pred is not None:
+                details.append({'path': p, 'pred': pred[0], 'conf': pred[1]})
         
         # Weighted majority vote based on confidence
-        unique_preds = np.unique(preds)
-        weighted_votes = {}
-        
-        for pred in unique_preds:
-            mask = preds == pred
-            weighted_votes[pred] = np.sum(confidences[mask])
-        
-        majority = max(weighted_votes, key=weighted_votes.get)
-        total_confidence = sum(weighted_votes.values())
-        conf = weighted_votes[majority] / total_confidence if total_confidence > 0 else 0.5
-        
-        return {
-            'severity': str(majority),
-            'confidence': float(conf),
-            'details': [{'path': p, 'pred': str(pr), 'conf': float(cf)} for p, pr, cf in zip(ok_paths, preds, confidences)]
-        }
+        return vote_severity(details)
@@ -5,6 +5,7 @@ Admin routes and functionality
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
 from database_models import db, User, DamageReport, RepairShop
+from sqlalchemy.orm import joinedload, selectinload
 from datetime import datetime, timedelta
 import json
 import os
@@ -55,7 +56,8 @@ def dashboard():
     recent_users = User.query.filter(User.created_at >= week_ago).count()
     
     # Recent damage reports
-    recent_damage_reports = DamageReport.query.order_by(DamageReport.created_at.desc()).limit(10).all()
+    recent_damage_reports = DamageReport.query.options(joinedload(DamageReport.user))\
+                                              .order_by(DamageReport.created_at.desc()).limit(10).all()
     
     # Vehicle types data for chart
     vehicle_types = db.session.query(DamageReport.vehicle_type, db.func.count(DamageReport.id)).group_by(DamageReport.vehicle_type).all()
@@ -105,7 +107,8 @@ def users():
     page = request.args.get('page', 1, type=int)
     per_page = 20
     
-    users = User.query.order_by(User.created_at.desc()).paginate(
+    # Report counts for the whole page come from one batched IN query
+    users = User.query.options(selectinload(User.damage_reports)).order_by(User.created_at.desc()).paginate(
         page=page, per_page=per_page, error_out=False
     )
     
@@ -154,7 +157,7 @@ def delete_user(user_id):
     for report in reports:
         if report.image_paths:
             try:
-                image_paths = json.loads(report.image_paths)
+                image_paths = report.image_paths
                 for image_path in image_paths:
                     full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], image_path)
                     if os.path.exists(full_path):
@@ -177,7 +180,7 @@ def reports():
     per_page = 20
     status_filter = request.args.get('status', 'all')
     
-    query = DamageReport.query
+    query = DamageReport.query.options(joinedload(DamageReport.user))
     
     if status_filter != 'all':
         query = query.filter_by(status=status_filter)
@@ -200,14 +203,14 @@ def report_detail(report_id):
     image_paths = []
     if report.image_paths:
         try:
-            image_paths = json.loads(report.image_paths)
+            image_paths = report.image_paths
         except:
             pass
     
     # Parse JSON fields for template
-    affected_areas = json.loads(report.affected_areas) if report.affected_areas else []
-    cost_breakdown = json.loads(report.cost_breakdown) if report.cost_breakdown else {}
-    recommendations = json.loads(report.recommendations) if report.recommendations else []
+    affected_areas = report.affected_areas or []
+    cost_breakdown = report.cost_breakdown or {}
+    recommendations = report.recommendations or []
     
     return render_template('admin/report_detail.html', 
                          report=report, 
@@ -248,7 +251,7 @@ def delete_report(report_id):
     # Delete associated images
     if report.image_paths:
         try:
-            image_paths = json.loads(report.image_paths)
+            image_paths = report.image_paths
             for image_path in image_paths:
                 full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], image_path)
                 if os.path.exists(full_path):
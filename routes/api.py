@@ -9,7 +9,6 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'models'))
 from repair_shop_finder import RepairShopFinder
-import json
 
 api_bp = Blueprint('api', __name__)
 
@@ -72,7 +71,7 @@ def get_report(report_id):
     if not report:
         return jsonify({'error': 'Report not found'}), 404
     
-    image_paths = json.loads(report.image_paths) if report.image_paths else []
+    image_paths = report.image_paths or []
     
     return jsonify({
         'id': report.id,
@@ -98,7 +97,7 @@ def delete_report(report_id):
     try:
         # Delete associated images if they exist
         if report.image_paths:
-            image_paths = json.loads(report.image_paths)
+            image_paths = report.image_paths
             for image_path in image_paths:
                 full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], image_path)
                 if os.path.exists(full_path):
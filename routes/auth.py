@@ -4,7 +4,6 @@ Authentication routes and functionality
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 from database_models import db, User
 import re
 import requests
@@ -43,11 +42,11 @@ def register():
         # Create new user
         user = User(
             email=email,
-            password_hash=generate_password_hash(password),
             first_name=first_name,
             last_name=last_name,
             phone=phone
         )
+        user.set_password(password)
         
         db.session.add(user)
         db.session.commit()
@@ -76,7 +75,11 @@ def login():
         
         user = User.query.filter_by(email=email).first()
         
-        if user and check_password_hash(user.password_hash, password):
+        if user and user.check_password(password):
+            # Persist a hash that check_password upgraded
+            if db.session.is_modified(user):
+                db.session.commit()
+            
             login_user(user, remember=remember)
             
             if request.is_json:
@@ -7,23 +7,38 @@ from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 import os
 import uuid
+import shutil
+import functools
 from datetime import datetime
 from database_models import db, DamageReport
-from models.hybrid_damage_detector import detect_damage_hybrid
-from cost_estimator_enhanced import estimate_repair_cost
-from models.severity_inference import ImprovedSeverityModel
-import json
 
 damage_bp = Blueprint('damage', __name__)
 
-# Initialize best model (severity_best - 57.04% accuracy)
-best_severity_model = ImprovedSeverityModel('models/saved_models/severity_best')
+@functools.cache
+def get_best_severity_model():
+    """Load best model (severity_best - 57.04% accuracy) on first use"""
+    from models.severity_inference import ImprovedSeverityModel
+    return ImprovedSeverityModel('models/saved_models/severity_best')
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def save_upload(file, dest_path):
+    """Write an uploaded file to dest_path in 1MB chunks, in-kernel if it was spooled to disk"""
+    stream = file.stream
+    stream.seek(0)
+    with open(dest_path, 'wb') as dest:
+        # SpooledTemporaryFile only has a real fd once it rolled over; fileno() would force it
+        if hasattr(os, 'sendfile') and getattr(stream, '_rolled', False):
+            size = os.fstat(stream.fileno()).st_size
+            offset = 0
+            while offset < size:
+                offset += os.sendfile(dest.fileno(), stream.fileno(), offset, size - offset)
+        else:
+            shutil.copyfileobj(stream, dest, 1024 * 1024)
+
 @damage_bp.route('/upload', methods=['GET', 'POST'])
 @login_required
 def upload_images():
@@ -47,7 +62,7 @@ def upload_images():
                 filename = secure_filename(file.filename)
                 unique_filename = f"{uuid.uuid4()}_{filename}"
                 file_path = os.path.join(upload_dir, unique_filename)
-                file.save(file_path)
+                save_upload(file, file_path)
                 saved_files.append(file_path)
         
         if not saved_files:
@@ -55,8 +70,12 @@ def upload_images():
         
         # Process images for damage detection
         try:
+            # AI/ML stack is imported on first analysis, not at app startup
+            from models.hybrid_damage_detector import detect_damage_hybrid
+            from cost_estimator_enhanced import estimate_repair_cost
+            
             # Use best severity model (57.04% accuracy)
-            severity_results = best_severity_model.predict_severity(saved_files)
+            severity_results = get_best_severity_model().predict_severity(saved_files)
             
             # Get damage analysis from Gemini
             results = detect_damage_hybrid(saved_files)
@@ -78,17 +97,17 @@ def upload_images():
                 severity=results.get('severity', 'Unknown'),
                 estimated_cost=cost_estimate.get('total_cost', 0),
                 confidence_score=results.get('confidence', 0),
-                image_paths=json.dumps(saved_files),
+                image_paths=saved_files,
                 status='completed',
                 # Additional fields
                 damage_description=results.get('damage_description'),
-                affected_areas=json.dumps(results.get('affected_areas', [])),
+                affected_areas=results.get('affected_areas', []),
                 repair_urgency=results.get('repair_urgency'),
                 estimated_repair_complexity=results.get('estimated_repair_complexity'),
                 safety_concerns=results.get('safety_concerns'),
                 repair_time_days=cost_estimate.get('repair_time_days'),
-                cost_breakdown=json.dumps(cost_estimate.get('cost_breakdown', {})),
-                recommendations=json.dumps(cost_estimate.get('recommendations', []))
+                cost_breakdown=cost_estimate.get('cost_breakdown', {}),
+                recommendations=cost_estimate.get('recommendations', [])
             )
             
             db.session.add(damage_report)
@@ -113,7 +132,7 @@ def results(report_id):
     report = DamageReport.query.filter_by(id=report_id, user_id=current_user.id).first_or_404()
     
     # Load image paths
-    image_paths = json.loads(report.image_paths) if report.image_paths else []
+    image_paths = report.image_paths or []
     
     return render_template('damage/results.html', 
                          report=report, 
@@ -143,11 +162,14 @@ def api_analyze():
     # Save temporary file
     temp_filename = f"temp_{uuid.uuid4()}.jpg"
     temp_path = os.path.join(current_app.config['UPLOAD_FOLDER'], temp_filename)
-    file.save(temp_path)
+    save_upload(file, temp_path)
     
     try:
+        from models.hybrid_damage_detector import detect_damage_hybrid
+        from cost_estimator_enhanced import estimate_repair_cost
+        
         # Analyze single image with best model
-        severity_results = best_severity_model.predict_severity([temp_path])
+        severity_results = get_best_severity_model().predict_severity([temp_path])
         results = detect_damage_hybrid([temp_path])
         
         # Update results with best severity
@@ -5,8 +5,6 @@ Report generation routes and functionality
 from flask import Blueprint, render_template, request, jsonify, make_response
 from flask_login import login_required, current_user
 from database_models import db, DamageReport
-from report_generator import ReportGenerator
-import json
 import io
 
 reports_bp = Blueprint('reports', __name__)
@@ -19,9 +17,10 @@ def generate_report(report_id):
         report = DamageReport.query.filter_by(id=report_id, user_id=current_user.id).first_or_404()
         
         # Load image paths
-        image_paths = json.loads(report.image_paths) if report.image_paths else []
+        image_paths = report.image_paths or []
         
-        # Generate PDF report
+        # Generate PDF report (reportlab is only imported when a PDF is requested)
+        from report_generator import ReportGenerator
         report_generator = ReportGenerator()
         pdf_data = report_generator.generate_pdf_report(report, image_paths)
         
@@ -61,12 +60,12 @@ def view_report(report_id):
     report = DamageReport.query.filter_by(id=report_id, user_id=current_user.id).first_or_404()
     
     # Load image paths
-    image_paths = json.loads(report.image_paths) if report.image_paths else []
+    image_paths = report.image_paths or []
     
     # Parse JSON fields for template
-    affected_areas = json.loads(report.affected_areas) if report.affected_areas else []
-    cost_breakdown = json.loads(report.cost_breakdown) if report.cost_breakdown else {}
-    recommendations = json.loads(report.recommendations) if report.recommendations else []
+    affected_areas = report.affected_areas or []
+    cost_breakdown = report.cost_breakdown or {}
+    recommendations = report.recommendations or []
     
     return render_template('reports/view.html', 
                          report=report, 
@@ -97,7 +96,7 @@ def export_report(report_id):
     report = DamageReport.query.filter_by(id=report_id, user_id=current_user.id).first_or_404()
     
     # Load image paths
-    image_paths = json.loads(report.image_paths) if report.image_paths else []
+    image_paths = report.image_paths or []
     
     report_data = {
         'id': report.id,
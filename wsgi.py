@@ -0,0 +1,10 @@
+"""
+WSGI entry point for production servers
+Run with gevent workers so slow OpenAI calls don't block other requests:
+
+    gunicorn -k gevent --workers 4 --worker-connections 1000 wsgi:application
+"""
+
+from app import app
+
+application = app